@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+from array import array
+
+
+class Arena(object):
+    """Occupancy grid covering the area inside the border. Every cell holds the
+    number of the player whose light cycle passed through it, so collision checks
+    are a single lookup instead of a scan through each trail."""
+
+    EMPTY = 0
+
+    def __init__(self, x_boundary, y_boundary):
+        self.x_boundary = int(x_boundary)
+        self.y_boundary = int(y_boundary)
+        self.columns = (self.x_boundary * 2) + 1
+        self.rows = (self.y_boundary * 2) + 1
+        self.cells = bytearray(self.columns * self.rows)
+        # Kept around so clear() is a single bulk copy
+        self.blank = bytes(len(self.cells))
+
+    def contains(self, x, y):
+        return abs(x) <= self.x_boundary and abs(y) <= self.y_boundary
+
+    def index(self, x, y):
+        """Converts a coordinate (origin in the centre) to its offset in cells."""
+        return (y + self.y_boundary) * self.columns + (x + self.x_boundary)
+
+    def owner(self, x, y):
+        """Returns the player number occupying the cell, or EMPTY."""
+        if not self.contains(x, y):
+            return self.EMPTY
+        return self.cells[self.index(x, y)]
+
+    def mark(self, x, y, owner):
+        """Tags the cell with the owner's player number."""
+        if self.contains(x, y):
+            self.cells[self.index(x, y)] = owner
+
+    def line(self, start, end, horizontal):
+        """Ascending slice of cells along the straight line from start to end
+        (inclusive), clipped to the arena. Returns (slice, position of its first
+        cell along the line), or None if the line misses the arena."""
+        (x0, y0), (x1, y1) = start, end
+        if horizontal:
+            if abs(y0) > self.y_boundary:
+                return None
+            low, high, bound = min(x0, x1), max(x0, x1), self.x_boundary
+        else:
+            if abs(x0) > self.x_boundary:
+                return None
+            low, high, bound = min(y0, y1), max(y0, y1), self.y_boundary
+        low, high = max(low, -bound), min(high, bound)
+        if low > high:
+            return None
+        if horizontal:
+            return slice(self.index(low, y0), self.index(high, y0) + 1), low
+        return slice(self.index(x0, low), self.index(x0, high) + 1, self.columns), low
+
+    def pieces(self, start, end, horizontal):
+        """The line from start to end as (cells, slice of them, position along the
+        line of the slice's first cell), for sweep. Always one piece, or none if the
+        line misses the arena."""
+        line = self.line(start, end, horizontal)
+        if line is None:
+            return []
+        span, low = line
+        return [(self.cells, span, low)]
+
+    def first_occupied(self, start, end):
+        """Sweeps the straight move from start (exclusive) to end (inclusive) in one
+        slice of the grid, so the cost barely grows with the length of the move.
+        Returns (steps from start, cell, owner) for the first occupied cell, or None."""
+        return sweep(self, start, end)
+
+    def mark_line(self, start, end, owner):
+        """Tags every cell on the straight line from start to end (inclusive) in one
+        slice assignment."""
+        if start == end:
+            self.mark(end[0], end[1], owner)
+            return
+        line = self.line(start, end, start[1] == end[1])
+        if line is not None:
+            span, low = line
+            self.cells[span] = bytes((owner,)) * len(range(*span.indices(len(self.cells))))
+
+    def clear(self):
+        """Empties every cell at once."""
+        self.cells[:] = self.blank
+
+
+class ChunkedArena(object):
+    """Occupancy map for arenas too big to allocate up front. The area is split into
+    square chunks, each a bytearray allocated the first time a trail enters it, so
+    memory follows the distance travelled rather than the area. Same interface as
+    Arena, minus the flat cells buffer."""
+
+    EMPTY = 0
+    SIZE = 64 # Cells along each side of a chunk
+
+    def __init__(self, x_boundary, y_boundary, size=SIZE):
+        self.x_boundary = int(x_boundary)
+        self.y_boundary = int(y_boundary)
+        self.size = size
+        self.chunks = {} # (chunk x, chunk y) -> bytearray, row by row
+
+    def contains(self, x, y):
+        return abs(x) <= self.x_boundary and abs(y) <= self.y_boundary
+
+    def chunk(self, key):
+        """The chunk at key, allocated if no trail has been there yet."""
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = bytearray(self.size * self.size)
+        return chunk
+
+    def owner(self, x, y):
+        if not self.contains(x, y):
+            return self.EMPTY
+        size = self.size
+        chunk = self.chunks.get((x // size, y // size))
+        if chunk is None:
+            return self.EMPTY
+        return chunk[(y % size) * size + x % size]
+
+    def mark(self, x, y, owner):
+        if self.contains(x, y):
+            size = self.size
+            self.chunk((x // size, y // size))[(y % size) * size + x % size] = owner
+
+    def spans(self, start, end, horizontal):
+        """Splits the straight line from start to end (inclusive, clipped to the arena)
+        into one piece per chunk, in ascending order: (chunk key, slice of the chunk,
+        position along the line of the slice's first cell)."""
+        (x0, y0), (x1, y1) = start, end
+        size = self.size
+        if horizontal:
+            fixed, low, high = y0, min(x0, x1), max(x0, x1)
+            fixed_bound, bound = self.y_boundary, self.x_boundary
+        else:
+            fixed, low, high = x0, min(y0, y1), max(y0, y1)
+            fixed_bound, bound = self.x_boundary, self.y_boundary
+        if abs(fixed) > fixed_bound:
+            return []
+        low, high = max(low, -bound), min(high, bound)
+        offset = fixed % size
+        pieces = []
+        for along in range(low // size, high // size + 1):
+            first = max(low, along * size) - along * size
+            last = min(high, along * size + size - 1) - along * size
+            if horizontal:
+                key = (along, fixed // size)
+                span = slice(offset * size + first, offset * size + last + 1)
+            else:
+                key = (fixed // size, along)
+                span = slice(first * size + offset, last * size + offset + 1, size)
+            pieces.append((key, span, along * size + first))
+        return pieces
+
+    def pieces(self, start, end, horizontal):
+        """Same as Arena.pieces, one per chunk the line crosses. Chunks no trail has
+        entered are left out without being allocated."""
+        pieces = []
+        for key, span, low in self.spans(start, end, horizontal):
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                pieces.append((chunk, span, low))
+        return pieces
+
+    def first_occupied(self, start, end):
+        """Same as Arena.first_occupied. Chunks no trail has entered are skipped
+        without being read."""
+        return sweep(self, start, end)
+
+    def mark_line(self, start, end, owner):
+        if start == end:
+            self.mark(end[0], end[1], owner)
+            return
+        for key, span, low in self.spans(start, end, start[1] == end[1]):
+            chunk = self.chunk(key)
+            chunk[span] = bytes((owner,)) * len(range(*span.indices(len(chunk))))
+
+    def clear(self):
+        """Drops every chunk, so a new round starts from no memory at all."""
+        self.chunks = {}
+
+
+def sweep(arena, start, end):
+    """First occupied cell on the straight move from start (exclusive) to end
+    (inclusive), for either arena. The cells along the move come from
+    arena.pieces, and each piece is scanned in one go for its first non-empty
+    byte. Returns (steps from start, cell, owner), or None."""
+    if abs(end[0] - start[0]) + abs(end[1] - start[1]) == 1:
+        owner = arena.owner(end[0], end[1])
+        if owner == arena.EMPTY:
+            return None
+        return (1, end, owner)
+    horizontal = start[1] == end[1]
+    position = start[0] if horizontal else start[1]
+    target = end[0] if horizontal else end[1]
+    if target == position:
+        return None
+    forward = target > position
+    first = position + 1 if forward else position - 1
+    if horizontal:
+        pieces = arena.pieces((first, start[1]), end, True)
+    else:
+        pieces = arena.pieces((start[0], first), end, False)
+    if not forward:
+        pieces.reverse()
+    for buffer, span, low in pieces:
+        cells = buffer[span]
+        if forward:
+            offset = len(cells) - len(cells.lstrip(b'\0'))
+            if offset == len(cells):
+                continue
+        else:
+            offset = len(cells.rstrip(b'\0')) - 1
+            if offset < 0:
+                continue
+        hit = low + offset
+        cell = (hit, start[1]) if horizontal else (start[0], hit)
+        return (abs(hit - position), cell, cells[offset])
+    return None
+
+
+def pack_cell(x, y):
+    """Encodes a cell as one int (x in the high bits) for the array-backed trail.
+    Both coordinates must fit in 16 signed bits."""
+    return (x << 16) + (y + 0x8000)
+
+
+def unpack_cell(key):
+    return (key >> 16, (key & 0xFFFF) - 0x8000)
+
+
+class Trail(object):
+    """Ordered cells covered by a light cycle, packed one int per cell into an
+    array. Appending a cell that is already part of the trail is ignored, and
+    membership is a set lookup on the packed ints, so a long round holds no tuples
+    for the garbage collector to track. Clear and reuse it rather than making a new
+    one each round.
+
+    With a capacity the trail is a ring buffer of its newest capacity cells: the
+    array is allocated once, twice over with every cell written to both halves, so
+    the oldest cell goes in constant time and any run of cells is still one slice.
+    Adding to a full ring overwrites the oldest cell; drop() it first to find out
+    which cell that is."""
+
+    __slots__ = ('cells', 'visited', 'head', 'capacity', 'start', 'count', 'added')
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        if capacity:
+            # Twice the capacity: every cell is written to both halves
+            self.cells = array('i', bytes(array('i').itemsize * 2 * capacity))
+        else:
+            self.cells = array('i')
+        self.visited = set()
+        self.head = None # Newest cell, kept unpacked since every tick starts from it
+        self.start = 0 # Index of the oldest cell in a ring
+        self.count = 0 # Cells in a ring
+        self.added = 0 # Cells appended since the last clear, including any dropped
+
+    def push(self, key):
+        """Puts a packed cell at the newest end of the ring."""
+        capacity = self.capacity
+        if self.count == capacity:
+            self.visited.discard(self.cells[self.start])
+            self.start = (self.start + 1) % capacity
+            self.count -= 1
+        index = (self.start + self.count) % capacity
+        self.cells[index] = self.cells[index + capacity] = key
+        self.count += 1
+        self.added += 1
+
+    def append(self, cell):
+        """Adds cell to the end of the trail. Returns False if it was already there."""
+        key = (cell[0] << 16) + (cell[1] + 0x8000)
+        if key in self.visited:
+            return False
+        self.visited.add(key)
+        if self.capacity:
+            self.push(key)
+        else:
+            self.cells.append(key)
+            self.added += 1
+        self.head = cell
+        return True
+
+    def extend(self, cells):
+        """Appends a run of cells, skipping any already in the trail."""
+        visited = self.visited
+        if self.capacity:
+            for x, y in cells:
+                key = (x << 16) + (y + 0x8000)
+                if key not in visited:
+                    visited.add(key)
+                    self.push(key)
+                    self.head = (x, y)
+            return
+        packed = self.cells
+        length = len(packed)
+        for x, y in cells:
+            key = (x << 16) + (y + 0x8000)
+            if key not in visited:
+                visited.add(key)
+                packed.append(key)
+                self.head = (x, y)
+        self.added += len(packed) - length
+
+    def skip(self, count):
+        """Counts cells that went past a ring too quickly to be kept in it, so added
+        still covers every cell entered."""
+        self.added += count
+
+    def drop(self, count):
+        """Takes the oldest count cells off a ring. Returns their packed ints as a
+        memoryview, good until the next append."""
+        count = max(0, min(count, self.count))
+        dropped = memoryview(self.cells)[self.start:self.start + count]
+        self.visited.difference_update(dropped)
+        self.start = (self.start + count) % self.capacity
+        self.count -= count
+        return dropped
+
+    def window(self):
+        """Where the cells are in the array, oldest first, as (start, end)."""
+        if self.capacity:
+            return self.start, self.start + self.count
+        return 0, len(self.cells)
+
+    def last(self, count):
+        """The packed ints of the newest count cells as a memoryview, without copying.
+        Decode with unpack_cell."""
+        start, end = self.window()
+        return memoryview(self.cells)[max(end - count, start):end]
+
+    def clear(self):
+        if not self.capacity:
+            del self.cells[:]
+        self.visited.clear()
+        self.head = None
+        self.start = self.count = self.added = 0
+
+    def __contains__(self, cell):
+        return pack_cell(cell[0], cell[1]) in self.visited
+
+    def __len__(self):
+        if self.capacity:
+            return self.count
+        return len(self.cells)
+
+    def __iter__(self):
+        start, end = self.window()
+        for key in self.cells[start:end]:
+            yield (key >> 16, (key & 0xFFFF) - 0x8000)
+
+    def __getitem__(self, index):
+        if not self.capacity:
+            return unpack_cell(self.cells[index])
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('trail index out of range')
+        return unpack_cell(self.cells[self.start + index])
+
+
+def segment_cells(start, end):
+    """Yields every cell from start (exclusive) to end (inclusive), one step at a
+    time. X is walked first, then y, so the path never cuts a corner diagonally."""
+    x, y = start
+    end_x, end_y = end
+    step = 1 if end_x > x else -1
+    while x != end_x:
+        x += step
+        yield (x, y)
+    step = 1 if end_y > y else -1
+    while y != end_y:
+        y += step
+        yield (x, y)
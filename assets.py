@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+import base64
+import threading
+import tkinter
+
+IMAGES = 'images'
+
+
+class Backdrop(object):
+    """Background images for the menu screens, decoded into Tk PhotoImages once and
+    shown by pointing a single canvas image item at them. Switching screens is a
+    reference swap, and showing the image that is already up costs nothing.
+
+    preload() reads and encodes the files on a background thread while the window
+    opens; the decode itself has to happen on the Tk thread, the first time each
+    image is shown."""
+
+    def __init__(self, directory=IMAGES):
+        self.directory = directory
+        self.data = {} # Name -> base64 GIF data read ahead by preload()
+        self.images = {} # Name -> PhotoImage
+        self.loader = None
+        self.canvas = None
+        self.item = None
+        self.showing = None
+
+    def preload(self):
+        self.loader = threading.Thread(target=self.read_all, daemon=True)
+        self.loader.start()
+
+    def read_all(self):
+        for filename in sorted(os.listdir(self.directory)):
+            name, extension = os.path.splitext(filename)
+            if extension == '.gif':
+                self.data[name] = self.read(name)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name + '.gif'), 'rb') as image:
+            # As text, so Tk takes it as base64 rather than raw bytes
+            return base64.b64encode(image.read()).decode('ascii')
+
+    def image(self, name):
+        """The decoded image called name (file name without .gif)."""
+        if name not in self.images:
+            if self.loader:
+                self.loader.join()
+                self.loader = None
+            data = self.data.pop(name, None) or self.read(name)
+            self.images[name] = tkinter.PhotoImage(master=self.canvas, data=data)
+        return self.images[name]
+
+    def show(self, screen, name):
+        """Shows the named image behind everything else on the screen, or nothing
+        if name is None."""
+        canvas = screen.getcanvas()
+        if canvas is not self.canvas:
+            self.canvas = canvas
+            # Turtle's canvas has its origin in the centre, like turtle itself
+            self.item = canvas.create_image(0, 0)
+            self.showing = None
+        if name == self.showing:
+            return
+        self.showing = name
+        if name is None:
+            canvas.itemconfigure(self.item, image='')
+        else:
+            canvas.itemconfigure(self.item, image=self.image(name))
+        canvas.tag_lower(self.item)
+
+    def hide(self, screen):
+        self.show(screen, None)
+
+
+_backdrop = None
+
+def get_backdrop():
+    """Shared Backdrop for the menu and the game."""
+    global _backdrop
+    if _backdrop is None:
+        _backdrop = Backdrop()
+    return _backdrop
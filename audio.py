@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import shutil
+import queue
+import threading
+import subprocess
+
+
+class NullBackend(object):
+    """Used when no audio player is available. Does nothing."""
+
+    name = 'none'
+
+    def supports(self, path):
+        return False
+
+    def play_command(self, path):
+        return None
+
+    def say_command(self, text):
+        return None
+
+
+class AfplayBackend(object):
+    """macOS: afplay for sound files, say for speech."""
+
+    name = 'afplay'
+
+    def supports(self, path):
+        return True
+
+    def play_command(self, path):
+        return ['afplay', path]
+
+    def say_command(self, text):
+        return ['say', text]
+
+
+class LinuxBackend(object):
+    """Linux: paplay or aplay for wav files, espeak for speech if installed.
+    Neither player handles m4a, so music is skipped."""
+
+    def __init__(self, player):
+        self.name = os.path.basename(player)
+        self.player = player
+        self.speaker = shutil.which('espeak')
+
+    def supports(self, path):
+        return path.lower().endswith('.wav')
+
+    def play_command(self, path):
+        return [self.player, path]
+
+    def say_command(self, text):
+        if self.speaker:
+            return [self.speaker, text]
+        return None
+
+
+def detect_backend():
+    """Picks the first audio player found on this machine, or NullBackend."""
+    if sys.platform == 'darwin' and shutil.which('afplay'):
+        return AfplayBackend()
+    for player in ('paplay', 'aplay'):
+        path = shutil.which(player)
+        if path:
+            return LinuxBackend(path)
+    return NullBackend()
+
+
+class AudioManager(object):
+    """Plays sounds on a worker thread so the game loop never waits on a fork.
+    Requests are queued and handled in order; the player processes it starts are
+    tracked so stop() only ends this game's sounds instead of every afplay."""
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = detect_backend()
+        self.backend = backend
+        self.cache = {} # path -> absolute path, or None if it can't be played
+        self.processes = []
+        self.requests = queue.Queue()
+        self.worker = None
+        if not isinstance(backend, NullBackend):
+            self.worker = threading.Thread(target=self.run, daemon=True)
+            self.worker.start()
+
+    def preload(self, *paths):
+        """Resolves sound files ahead of time: the absolute path, and whether the
+        backend can play them at all. The player process still reads the file
+        itself each time it plays."""
+        for path in paths:
+            self.resolve(path)
+
+    def resolve(self, path):
+        if path not in self.cache:
+            full_path = os.path.abspath(path)
+            if os.path.isfile(full_path) and self.backend.supports(full_path):
+                self.cache[path] = full_path
+            else:
+                self.cache[path] = None
+        return self.cache[path]
+
+    def play(self, path):
+        """Queues a sound file. Returns immediately."""
+        self.send('play', path)
+
+    def say(self, text):
+        """Queues a spoken phrase. Returns immediately."""
+        self.send('say', text)
+
+    def stop(self):
+        """Stops every sound started so far. Returns immediately."""
+        self.send('stop', None)
+
+    def send(self, action, arg):
+        if self.worker:
+            self.requests.put((action, arg))
+
+    def run(self):
+        """Worker thread. Starts and stops player processes as requests arrive."""
+        while True:
+            action, arg = self.requests.get()
+            if action == 'close':
+                self.kill_all()
+                return
+            elif action == 'stop':
+                self.kill_all()
+            elif action == 'play':
+                path = self.resolve(arg)
+                if path:
+                    self.start(self.backend.play_command(path))
+            elif action == 'say':
+                self.start(self.backend.say_command(arg))
+
+    def start(self, command):
+        # Forget players that have already finished
+        self.processes = [process for process in self.processes if process.poll() is None]
+        if not command:
+            return
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL)
+        except OSError:
+            return
+        self.processes.append(process)
+
+    def kill_all(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+        self.processes = []
+
+    def close(self):
+        """Stops all sounds and ends the worker thread."""
+        if self.worker:
+            self.requests.put(('close', None))
+            self.worker.join(1)
+            self.worker = None
+
+
+_manager = None
+
+def get_manager():
+    """Shared AudioManager for the menu and the game."""
+    global _manager
+    if _manager is None:
+        _manager = AudioManager()
+    return _manager
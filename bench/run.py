@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Benchmarks for the swept collision checks, trail claiming, and whole headless ticks.
+
+Runs without a display. Results are written as JSON and compared against a stored
+baseline; the exit status is 1 if anything got slower than the tolerance and the
+spread measured between rounds allow. --quick is a smoke test and is not compared.
+
+    python3 bench/run.py
+    python3 bench/run.py --quick
+    python3 bench/run.py --save-baseline
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from simulation import Simulation, Move, GRID_SIZES
+from controllers import AvoidController
+
+BASELINE = os.path.join(ROOT, 'bench', 'baseline.json')
+TRAIL_SIZES = [('1k', 1000), ('10k', 10000), ('100k', 100000)]
+
+
+def lay_trail(simulation, cycle, length, row_start):
+    """Lays a serpentine trail of length cells for cycle, sweeping rows from
+    row_start upwards, every other row so the rows don't touch. Returns the row
+    after the last one used."""
+    x_limit = simulation.x_limit
+    y = row_start
+    direction = 1
+    laid = 0
+    while laid < length:
+        xs = list(range(-x_limit, x_limit + 1))
+        if direction < 0:
+            xs.reverse()
+        run = [(x, y) for x in xs[:length - laid]]
+        simulation.claim(cycle, run)
+        laid += len(run)
+        y += 2
+        direction = -direction
+    return y
+
+
+def trail_simulation(length):
+    """Large grid with P1 and P2 each holding a trail of length cells."""
+    simulation = Simulation(*GRID_SIZES['large'], seed=0)
+    simulation.create_cycles(2)
+    me, enemy = simulation.cycles
+    row = lay_trail(simulation, me, length, -simulation.y_limit)
+    lay_trail(simulation, enemy, length, row + 1)
+    return simulation
+
+
+ROUNDS = 9 # Every figure is the median of this many rounds, to shake off noise
+
+
+def per_call(function, args, repeat):
+    """A round of repeat calls of function(*args) for each args in turn. The round
+    returns nanoseconds per call."""
+    def round():
+        start = time.perf_counter()
+        for i in range(repeat):
+            for each in args:
+                function(*each)
+        return (time.perf_counter() - start) / (repeat * len(args)) * 1e9
+    return round
+
+
+def probe_cells(simulation, rng):
+    """Cells for P1 to check: half on a trail, half random cells anywhere in the arena."""
+    me, enemy = simulation.cycles
+    cells = [me.positions[rng.randrange(len(me.positions))] for i in range(50)]
+    cells += [enemy.positions[rng.randrange(len(enemy.positions))] for i in range(50)]
+    x_limit, y_limit = simulation.x_limit, simulation.y_limit
+    cells += [(rng.randint(-x_limit, x_limit), rng.randint(-y_limit, y_limit))
+              for i in range(100)]
+    return cells
+
+
+def probe_moves(simulation, rng):
+    """Top speed moves for P1: half cross a trail cell, half start from random cells
+    anywhere in the arena."""
+    me, enemy = simulation.cycles
+    moves = []
+    for trail in (me.positions, enemy.positions):
+        for i in range(50):
+            x, y = trail[rng.randrange(len(trail))]
+            # Up through the row the trail cell sits on
+            moves.append(Move(me, (x, y - 2), (x, y + 1)))
+    x_limit = simulation.x_limit - 3
+    y_limit = simulation.y_limit - 3
+    for i in range(100):
+        x, y = rng.randint(-x_limit, x_limit), rng.randint(-y_limit, y_limit)
+        dx, dy = rng.choice(((1, 0), (-1, 0), (0, 1), (0, -1)))
+        moves.append(Move(me, (x, y), (x + dx * 3, y + dy * 3)))
+    return moves
+
+
+def claims(simulation, calls):
+    """A round of calls claims of top speed (3 cell) moves for P1, along rows from
+    the top of the arena down, so each round claims free cells. The round returns
+    nanoseconds per call."""
+    me = simulation.cycles[0]
+    x_limit = simulation.x_limit
+    rows = iter(range(simulation.y_limit, -simulation.y_limit, -1))
+    def round():
+        runs = []
+        while len(runs) < calls:
+            row = next(rows)
+            runs += [[(x + 1, row), (x + 2, row), (x + 3, row)]
+                     for x in range(-x_limit - 1, x_limit - 2, 3)]
+        runs = runs[:calls]
+        start = time.perf_counter()
+        for run in runs:
+            simulation.claim(me, run)
+        return (time.perf_counter() - start) / calls * 1e9
+    return round
+
+
+def collision_cases(repeat, calls):
+    """(name, unit, round) for the collision checks and claiming, on each trail size."""
+    cases = []
+    for label, length in TRAIL_SIZES:
+        simulation = trail_simulation(length)
+        me = simulation.cycles[0]
+        rng = random.Random(length)
+        probes = [(me, cell) for cell in probe_cells(simulation, rng)]
+        moves = probe_moves(simulation, rng)
+        cases += [
+            ('is_collision_with_self/' + label, 'ns/call',
+             per_call(simulation.is_collision_with_self, probes, repeat)),
+            ('is_collision_with_enemy/' + label, 'ns/call',
+             per_call(simulation.is_collision_with_enemy, probes, repeat)),
+            ('first_obstacle/' + label, 'ns/call',
+             per_call(simulation.first_obstacle, [(move,) for move in moves], repeat)),
+            ('first_occupied/' + label, 'ns/call',
+             per_call(simulation.arena.first_occupied,
+                      [(move.start, move.end) for move in moves], repeat)),
+            ('claim/' + label, 'ns/call', claims(simulation, calls)),
+        ]
+    return cases
+
+
+def tick_cases(ticks):
+    """(name, unit, round) for whole headless ticks, ticks of them per round."""
+    cases = []
+    for grid in ('small', 'medium', 'large'):
+        for players in (2, 4):
+            cases.append(('ticks/%dp/%s' % (players, grid), 'ticks/s',
+                          lambda grid=grid, players=players:
+                          ticks / time_ticks(grid, players, ticks)))
+    return cases
+
+
+def time_ticks(grid, players, ticks):
+    """Seconds to play ticks headless ticks with wall-avoiding controllers."""
+    simulation = Simulation(*GRID_SIZES[grid], seed=1)
+    simulation.create_cycles(players)
+    controllers = [AvoidController(simulation, cycle, random.Random(cycle.number))
+                   for cycle in simulation.cycles]
+    start = time.perf_counter()
+    for i in range(ticks):
+        for controller in controllers:
+            command = controller.decide()
+            if command is not None:
+                simulation.push_input(controller.cycle.number, command)
+        simulation.step()
+        # Keep going past the end of a match; only throughput matters here
+        if simulation.is_game_over():
+            for cycle in simulation.cycles:
+                cycle.lives = 5
+    return time.perf_counter() - start
+
+
+def run(cases, rounds):
+    """Plays every case once per round, interleaved so a slow patch on the machine
+    hits them all alike. Each result is the median round and its spread: the
+    interquartile range as a fraction of the median."""
+    samples = dict((name, []) for name, unit, round in cases)
+    for each in range(rounds):
+        for name, unit, round in cases:
+            samples[name].append(round())
+    results = {}
+    for name, unit, round in cases:
+        values = sorted(samples[name])
+        median = values[len(values) // 2]
+        quarter = len(values) // 4
+        spread = (values[-1 - quarter] - values[quarter]) / median
+        results[name] = {'value': median, 'spread': spread, 'unit': unit}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Prints every metric next to its baseline. Returns the names of the ones that
+    got slower by more than tolerance (a fraction) plus the spread of both runs, so
+    ordinary noise doesn't count as a regression."""
+    regressions = []
+    print('{:<36} {:>14} {:>14} {:>8} {:>8}'.format('benchmark', 'result', 'baseline',
+                                                    'change', 'limit'))
+    for name, result in results.items():
+        value = result['value']
+        line = '{:<36} {:>14.1f}'.format(name, value)
+        if name in baseline:
+            old = baseline[name]['value']
+            # ns/call: lower is better. ticks/s: higher is better.
+            if result['unit'] == 'ticks/s':
+                change = (old - value) / old
+            else:
+                change = (value - old) / old
+            limit = tolerance + result['spread'] + baseline[name].get('spread', 0)
+            line += ' {:>14.1f} {:>+7.0%} {:>7.0%}'.format(old, change, limit)
+            if change > limit:
+                regressions.append(name)
+                line += '  SLOWER'
+        print(line + ' ' + result['unit'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=os.path.join(ROOT, 'bench_output.json'),
+                        help='where to write the results as JSON')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fraction slower than baseline, on top of the measured spread, '
+                             'that counts as a regression')
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer, shorter rounds, for a smoke test; not compared with '
+                             'the baseline')
+    args = parser.parse_args()
+    if args.quick and args.save_baseline:
+        parser.error('--quick results are too rough to save as the baseline')
+
+    rounds, repeat, calls, ticks = (ROUNDS, 100, 3000, 3000)
+    if args.quick:
+        rounds, repeat, calls, ticks = (3, 5, 300, 200)
+
+    results = run(collision_cases(repeat, calls) + tick_cases(ticks), rounds)
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'rounds': rounds,
+        'results': results,
+    }
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        print('Saved baseline to {}'.format(args.baseline))
+        return 0
+
+    baseline = {}
+    if args.quick:
+        print('Quick run, not compared with the baseline')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as stored:
+            baseline = json.load(stored)['results']
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print('{} benchmark(s) slower than baseline'.format(len(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import time
+
+TICK_RATE = 100 # Simulation ticks per second
+FPS = 60 # Render frame cap
+
+
+class FrameClock(object):
+    """Fixed timestep loop. The simulation advances in ticks of exactly 1/tick_rate
+    seconds no matter how fast the machine is, while rendering is capped at fps.
+    If rendering falls behind, render frames are skipped so the simulation keeps
+    its pace, and the loop sleeps whenever nothing is due."""
+
+    def __init__(self, tick_rate=TICK_RATE, fps=FPS, max_catch_up=10,
+                 timer=time.perf_counter, sleep=time.sleep):
+        self.tick_time = 1.0 / tick_rate
+        self.frame_time = 1.0 / fps
+        # Most ticks run back to back before rendering. Past that the backlog is
+        # dropped so a long stall (e.g. window drag) can't snowball.
+        self.max_catch_up = max_catch_up
+        self.timer = timer
+        self.sleep = sleep
+        self.ticks = 0
+        self.frames = 0
+        self.skipped_frames = 0
+
+    def run(self, update, render, running):
+        """Calls update() once per tick and render(alpha) at most fps times a second
+        until running() returns False. Alpha is the fraction of a tick elapsed since
+        the last update, for renderers that want to interpolate."""
+        previous = self.timer()
+        next_frame = previous
+        lag = 0.0
+        while running():
+            now = self.timer()
+            lag += now - previous
+            previous = now
+
+            ticks = 0
+            while lag >= self.tick_time and ticks < self.max_catch_up and running():
+                update()
+                lag -= self.tick_time
+                ticks += 1
+            self.ticks += ticks
+            if ticks == self.max_catch_up:
+                lag = 0.0
+
+            if now >= next_frame:
+                render(lag / self.tick_time)
+                self.frames += 1
+                next_frame += self.frame_time
+                # Behind by more than a frame: skip the missed frames
+                if next_frame < now:
+                    self.skipped_frames += int((now - next_frame) / self.frame_time) + 1
+                    next_frame = now + self.frame_time
+
+            next_tick = now + (self.tick_time - lag)
+            delay = min(next_tick, next_frame) - self.timer()
+            if delay > 0:
+                self.sleep(delay)
+
+
+class FrameTimer(object):
+    """Average and max duration of something done once per frame. Figures are kept
+    per window of frames, so a cost that creeps up over a long round shows up as
+    later windows getting slower."""
+
+    def __init__(self, window=600):
+        self.window = window
+        self.frames = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.windows = 0
+        self.last_report = None
+
+    def add(self, seconds):
+        """Adds one frame's duration. Returns True when a window has just filled,
+        with its figures in last_report as (window number, average, max) in ms."""
+        self.frames += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if self.frames < self.window:
+            return False
+        self.windows += 1
+        self.last_report = (self.windows, self.total / self.frames * 1000, self.max * 1000)
+        self.frames = 0
+        self.total = 0.0
+        self.max = 0.0
+        return True
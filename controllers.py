@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+import time
+import random
+from arena import ChunkedArena
+from simulation import DIRECTIONS, TURN_LEFT, TURN_RIGHT
+
+
+class Controller(object):
+    """Drives one light cycle. decide() is called once per tick before the
+    simulation steps and returns an input command, or None to carry on."""
+
+    def __init__(self, simulation, cycle, rng=None):
+        self.simulation = simulation
+        self.cycle = cycle
+        self.random = rng or random.Random()
+
+    def decide(self):
+        return None
+
+    def is_free(self, heading, distance=1):
+        """Checks whether the cells up to distance ahead along heading are free."""
+        dx, dy = DIRECTIONS[heading]
+        x, y = self.cycle.coord
+        for step in range(1, distance + 1):
+            coord = (x + dx * step, y + dy * step)
+            if self.simulation.crash_cause(self.cycle, coord):
+                return False
+        return True
+
+
+class RandomController(Controller):
+    """Turns at random every so often. Crashes a lot."""
+
+    TURN_CHANCE = 0.03
+
+    def decide(self):
+        if self.random.random() < self.TURN_CHANCE:
+            return self.random.choice((TURN_LEFT, TURN_RIGHT))
+        return None
+
+
+class AvoidController(RandomController):
+    """Random turns, but never into something, and swerves when the next move
+    would crash."""
+
+    def decide(self):
+        heading = self.cycle.heading
+        turns = {TURN_LEFT: (heading + 90) % 360, TURN_RIGHT: (heading - 90) % 360}
+        if self.is_free(heading, self.cycle.fd_speed):
+            command = super(AvoidController, self).decide()
+            if command is not None and self.is_free(turns[command], self.cycle.fd_speed):
+                return command
+            return None
+        for command in (TURN_LEFT, TURN_RIGHT):
+            if self.is_free(turns[command]):
+                return command
+        return None
+
+
+class ScriptedController(Controller):
+    """Plays back a fixed script of (tick, command) pairs, in tick order."""
+
+    def __init__(self, simulation, cycle, rng=None, script=()):
+        super(ScriptedController, self).__init__(simulation, cycle, rng)
+        self.script = iter(script)
+        self.next_command = next(self.script, None)
+
+    def decide(self):
+        # decide() runs before the tick it steers
+        tick = self.simulation.ticks + 1
+        while self.next_command and self.next_command[0] < tick:
+            self.next_command = next(self.script, None)
+        if self.next_command and self.next_command[0] == tick:
+            command = self.next_command[1]
+            self.next_command = next(self.script, None)
+            return command
+        return None
+
+
+class BotController(Controller):
+    """Computer opponent. For going straight, left, and right it estimates how much
+    of the arena it would reach before any opponent (a Voronoi split found with one
+    breadth first search from every head at once) and takes the move with the most
+    room. The search reads the live arena grid directly, on either kind of arena,
+    and records the cells it reached in a dict kept for the next search. Each
+    search stops at search_limit cells or when the tick's time budget runs out,
+    and the bot only re-plans every few ticks unless something is close ahead.
+    With budget None there's no time limit, only search_limit, so the bot plays
+    the same way however busy the machine is."""
+
+    CHECK_EVERY = 32 # Cells searched between looks at the clock
+
+    def __init__(self, simulation, cycle, rng=None, budget=0.003, search_limit=600,
+                 replan_every=8, lookahead=12):
+        super(BotController, self).__init__(simulation, cycle, rng)
+        self.budget = budget # Seconds of thinking allowed per tick, or None
+        self.search_limit = search_limit
+        self.replan_every = replan_every
+        self.lookahead = lookahead
+        self.last_plan = -replan_every
+        arena = simulation.arena
+        # Playable area, matching the simulation's boundary check
+        self.x_limit = simulation.x_limit
+        self.y_limit = simulation.y_limit
+        # The search numbers cells as Arena.index does. A chunked arena has no flat
+        # buffer, so it's read through ChunkedCells.
+        self.x_boundary = arena.x_boundary
+        self.y_boundary = arena.y_boundary
+        self.columns = (arena.x_boundary * 2) + 1
+        if isinstance(arena, ChunkedArena):
+            self.cells = ChunkedCells(arena)
+        else:
+            self.cells = arena.cells
+        # Who reached each cell in the current search (0 = this bot, 1 = an opponent,
+        # 2 = both at once), by cell index. Reused from search to search.
+        self.reached = {}
+
+    def decide(self):
+        heading = self.cycle.heading
+        ticks = self.simulation.ticks
+        if (ticks - self.last_plan < self.replan_every and
+                self.is_free(heading, self.lookahead)):
+            return None
+        self.last_plan = ticks
+        end = None
+        if self.budget is not None:
+            end = time.perf_counter() + self.budget
+        best_command, best_score = None, None
+        # Straight first, so it wins ties
+        options = ((None, 0), (TURN_LEFT, 90), (TURN_RIGHT, -90))
+        for done, (command, turn) in enumerate(options):
+            new_heading = (heading + turn) % 360
+            if not self.is_free(new_heading, self.cycle.fd_speed):
+                continue
+            dx, dy = DIRECTIONS[new_heading]
+            x, y = self.cycle.coord
+            start = (x + dx * self.cycle.fd_speed, y + dy * self.cycle.fd_speed)
+            # Each option gets an equal share of what's left of the budget, so
+            # they're compared fairly and the whole tick stays within it
+            deadline = None
+            if end is not None:
+                now = time.perf_counter()
+                deadline = now + (end - now) / (len(options) - done)
+            score = self.territory(start, deadline, self.cells, self.reached)
+            if best_score is None or score > best_score:
+                best_command, best_score = command, score
+        return best_command
+
+    def territory(self, start, deadline, cells, reached):
+        """Cells this bot reaches from start before any opponent reaches them from
+        its head, minus the cells opponents reach first. cells gives the owner of
+        each cell by index (Arena.cells or ChunkedCells), and reached is the dict
+        the search records who reached each cell in; it's cleared first."""
+        x_boundary, y_boundary, columns = self.x_boundary, self.y_boundary, self.columns
+        reached.clear()
+
+        frontier = []
+        sources = [(start, 0)]
+        for cycle in self.simulation.cycles:
+            if cycle is not self.cycle and cycle.lives > 0:
+                sources.append((cycle.coord, 1))
+        for (x, y), who in sources:
+            if abs(x) > self.x_limit or abs(y) > self.y_limit:
+                continue
+            index = (y + y_boundary) * columns + (x + x_boundary)
+            if index in reached:
+                reached[index] = 2
+            else:
+                reached[index] = who
+                frontier.append((index, x, y))
+
+        mine = theirs = visited = 0
+        x_limit, y_limit = self.x_limit, self.y_limit
+        check_every = self.CHECK_EVERY
+        while frontier and visited < self.search_limit:
+            next_frontier = []
+            layer = set() # Cells first reached in this layer
+            for index, x, y in frontier:
+                if deadline is not None and not visited % check_every and \
+                time.perf_counter() > deadline:
+                    return mine - theirs
+                who = reached[index]
+                if who == 0:
+                    mine += 1
+                elif who == 1:
+                    theirs += 1
+                visited += 1
+                if who == 2:
+                    continue # Contested cells don't spread
+                for step, nx, ny in ((1, x + 1, y), (-1, x - 1, y),
+                                     (columns, x, y + 1), (-columns, x, y - 1)):
+                    if abs(nx) > x_limit or abs(ny) > y_limit:
+                        continue
+                    neighbour = index + step
+                    if cells[neighbour]:
+                        continue
+                    if neighbour in reached:
+                        # Reached in this same layer by the other side
+                        if reached[neighbour] != who and neighbour in layer:
+                            reached[neighbour] = 2
+                        continue
+                    reached[neighbour] = who
+                    layer.add(neighbour)
+                    next_frontier.append((neighbour, nx, ny))
+            frontier = next_frontier
+        return mine - theirs
+
+
+class ChunkedCells(object):
+    """Reads a chunked arena by flat cell index, numbered as Arena.index does, so
+    the bot's search can treat it like Arena.cells."""
+
+    __slots__ = ('arena', 'columns')
+
+    def __init__(self, arena):
+        self.arena = arena
+        self.columns = (arena.x_boundary * 2) + 1
+
+    def __getitem__(self, index):
+        y, x = divmod(index, self.columns)
+        return self.arena.owner(x - self.arena.x_boundary, y - self.arena.y_boundary)
+
+
+CONTROLLERS = {
+    'random': RandomController,
+    'avoid': AvoidController,
+    'bot': BotController,
+}
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import turtle
+from controllers import Controller
+from simulation import (TURN_LEFT, TURN_RIGHT, ACCELERATE, DECELERATE,
+                        GO_EAST, GO_NORTH, GO_WEST, GO_SOUTH)
+
+# Absolute controls: key -> direction the light cycle should go
+ABSOLUTE_KEYS = [
+    {'d': GO_EAST, 'w': GO_NORTH, 'a': GO_WEST, 's': GO_SOUTH}, # P1
+    {'Right': GO_EAST, 'Up': GO_NORTH, 'Left': GO_WEST, 'Down': GO_SOUTH}, # P2
+]
+
+# Relative controls: key -> turn or speed change
+RELATIVE_KEYS = [
+    {'a': TURN_LEFT, 'd': TURN_RIGHT, 'w': ACCELERATE, 's': DECELERATE}, # P1
+    {'Left': TURN_LEFT, 'Right': TURN_RIGHT, 'Up': ACCELERATE, 'Down': DECELERATE}, # P2
+]
+
+
+class KeyDispatcher(object):
+    """Binds each key to Tk once and routes presses through an action table.
+    Changing what a key does is a dict update, so nothing needs rebinding per frame.
+    turtle's screen.clear() drops every binding, so call listen() again after one."""
+
+    def __init__(self):
+        self.actions = {}
+
+    def set_action(self, key, action):
+        self.actions[key] = action
+
+    def clear(self):
+        self.actions = {}
+
+    def dispatch(self, key):
+        action = self.actions.get(key)
+        if action:
+            action()
+
+    def listen(self, keys=None):
+        """Binds every key (those in the action table by default) and gives the
+        window focus."""
+        if keys is None:
+            keys = list(self.actions)
+        for key in keys:
+            turtle.onkeypress(lambda key=key: self.dispatch(key), key)
+        turtle.listen()
+
+
+def queue_action(simulation, number, command):
+    """Key action that queues the command for the next simulation tick."""
+    def action():
+        simulation.push_input(number, command)
+    return action
+
+
+class KeyboardController(Controller):
+    """Light cycle driven from the keyboard. Presses are queued straight into the
+    simulation from the key handlers, so decide() has nothing to add."""
+
+    def __init__(self, simulation, cycle, rng=None, keys=None):
+        super(KeyboardController, self).__init__(simulation, cycle, rng)
+        self.keys = keys or {}
+
+    def bind(self, dispatcher):
+        """Fills the dispatcher's action table with this player's keys. Absolute
+        directions are translated with the player's heading when the tick applies them."""
+        for key, command in self.keys.items():
+            dispatcher.set_action(key, queue_action(self.simulation, self.cycle.number, command))
+
+
+def bind_remote(dispatcher, client, relative_controls):
+    """Binds both key maps to the local player of a networked match; presses are
+    sent straight to the server."""
+    if relative_controls:
+        key_maps = RELATIVE_KEYS
+    else:
+        key_maps = ABSOLUTE_KEYS
+    for keys in key_maps:
+        for key, command in keys.items():
+            dispatcher.set_action(key, lambda command=command: client.send(command))
+
+
+def keyboard_controllers(simulation, relative_controls):
+    """KeyboardControllers for as many players as there are key maps (two)."""
+    if relative_controls:
+        key_maps = RELATIVE_KEYS
+    else:
+        key_maps = ABSOLUTE_KEYS
+    controllers = []
+    for cycle, keys in zip(simulation.cycles, key_maps):
+        controllers.append(KeyboardController(simulation, cycle, keys=keys))
+    return controllers
@@ -3,33 +3,83 @@
 import turtle
 import random
 import time
-import os
+import argparse
+from collections import deque
+import audio
+import assets
+from simulation import Simulation, GRID_SIZES, PLAYER_COLORS
+from particles import ParticleSystem
+from clock import FrameClock, FrameTimer, TICK_RATE, FPS
+from controls import KeyDispatcher, KeyboardController, keyboard_controllers, bind_remote
+from controllers import BotController
+from profiler import Profiler, NULL_PROFILER
+from replay import ReplayReader, ReplayWriter
 
 # Currently set to absolute key bindings.
 
+# Largest window. Bigger arenas are seen through a Camera that follows a light cycle.
+VIEW_SIZE = (1024, 768)
+
 class Game(object):
     """Creates screen, draws border, creates all sprites, maps keys, draws score, and
     runs game loop."""
 
     # relative_controls = False
 
-    def __init__(self, width=None, height=None, relative_controls=False):
+    def __init__(self, width=None, height=None, relative_controls=False,
+                 tick_rate=TICK_RATE, fps=FPS, seed=None, record=None, replay=None,
+                 render_stats=False, hud_stats=False, bots=0, profile=False,
+                 profile_overlay=False, connect=None, pool=None, keys=None, trail_length=None):
         self.width = width
         self.height = height
         self.relative_controls = relative_controls
+        # fd_speed is cells per tick, so the tick rate sets how fast the game plays
+        self.tick_rate = tick_rate
+        self.fps = fps
+        self.seed = seed
+        # Snake mode: trails keep only their newest trail_length cells
+        self.trail_length = trail_length
+        self.audio = audio.get_manager()
+        # Turtles and key bindings are shared with the menu when it runs the session,
+        # so match after match reuses the same objects
+        self.pool = pool or TurtlePool()
+        self.keys = keys or KeyDispatcher()
+        self.particles_per_crash = 20
+        # Computer players filling the slots after the two keyboard players
+        self.bots = bots
+        # Per-phase timings, dumped when the game ends and optionally shown on screen
+        self.profiler = NULL_PROFILER
+        if profile or profile_overlay:
+            self.profiler = Profiler()
+        self.profile_overlay = profile_overlay
+        # Print how long turtle.update() takes every few seconds
+        self.render_stats = render_stats
+        self.update_timer = FrameTimer(window=fps * 5)
+        # Show tick rate, frame time, and trail lengths in the corner
+        self.hud_stats = hud_stats
+        # Path to stream a replay of this match to
+        self.record = record
+        # Path of a replay to play back instead of taking keyboard input
+        self.replay = None
+        if replay:
+            self.replay = ReplayReader(replay)
+            self.width, self.height = self.replay.width, self.replay.height
+        # (host, port) of a match server that runs the simulation instead of us
+        self.remote = None
+        if connect:
+            # asyncio is slow to import, so only networked matches pay for it
+            from net import MatchClient
+            self.remote = MatchClient(*connect)
+            self.remote.connect()
+            self.width, self.height = self.remote.width, self.remote.height
 
     def screen_size(self):
         """Only used if script runs directly."""
-        choices = ['small', 'medium', 'large']
         size = ''
-        while size not in choices:
-            size = input('Grid size: (Small, Medium, Large) ').lower().strip()
-            if size == 'small':
-                return (640, 480)
-            elif size == 'medium':
-                return (800, 600)
-            elif size == 'large':
-                return (1024, 768)
+        while size not in GRID_SIZES:
+            size = input('Grid size: (Small, Medium, Large, Huge) ').lower().strip()
+            if size in GRID_SIZES:
+                return GRID_SIZES[size]
             else:
                 print('{} is not a valid size.'.format(size))
 
@@ -38,18 +88,26 @@ class Game(object):
         Otherwise, screen is automatically created with arguments from main.py script."""
         if not self.width or not self.height:
             self.width, self.height = self.screen_size()
+        self.view_width = min(self.width, VIEW_SIZE[0])
+        self.view_height = min(self.height, VIEW_SIZE[1])
         self.screen = turtle.Screen()
         self.screen.bgcolor('black')
-        self.screen.setup(self.width, self.height, startx=None, starty=None)
+        assets.get_backdrop().hide(self.screen)
+        self.screen.setup(self.view_width, self.view_height, startx=None, starty=None)
         self.screen.title('TURTLETRON')
         self.screen.tracer(0)
 
     def draw_border(self):
         """Border is drawn from the width and height, starting in upper
         right hand corner. Each side is 50 pixels from the edge of the screen.
-        The border coordinates will be used for border detection as well."""
-        self.x_boundary = (self.width / 2) - 50
-        self.y_boundary = (self.height / 2) - 50
+        The border coordinates come from the simulation, which uses them for border
+        detection as well. A big arena's border is drawn by its ArenaView instead."""
+        self.x_boundary = self.simulation.x_boundary
+        self.y_boundary = self.simulation.y_boundary
+        if self.view:
+            # Nothing to draw, but the pen would still show at the centre
+            self.pen.hideturtle()
+            return
         self.pen.color('blue')
         self.pen.penup()
         self.pen.setposition(self.x_boundary, self.y_boundary)
@@ -70,345 +128,741 @@ class Game(object):
         self.pen.penup()
         self.pen.hideturtle()
 
-    def random_coord(self):
-        """Generates random coordinate within playable area with 50 px padding from boundary"""
-        x = random.randint(-(self.x_boundary - 50), (self.x_boundary - 50))
-        y = random.randint(-(self.y_boundary - 50), (self.y_boundary - 50))
-        return (x, y)
-
-    def is_outside_boundary(self, player):
-        """Checks if light cycle is out of bounds using border coord.
-        Deviation of 3 on edge to cosmetically match impact."""
-        if (abs(player.xcor()) > abs(self.x_boundary) - 3 or 
-            abs(player.ycor()) > abs(self.y_boundary) - 3):
-            return True
-
-    def position_range_adder(self, player):
-        """If speed is > 1, the positions aren't recorded between the speed gap. Therefore,
-        this function is needed to fill in the gaps and append the missing positions"""
-        prev_x_pos, prev_y_pos = player.positions[-2] # tuple unpacking
-        next_x_pos, next_y_pos = player.positions[-1]
-        positions_range = []
-        # X coord are changing and the difference between them is greater than 1
-        if abs(prev_x_pos - next_x_pos) > 1:
-            start = min(prev_x_pos, next_x_pos) + 1
-            end = max(prev_x_pos, next_x_pos)
-            for x_position in range(start, end):
-                coord = (x_position, prev_y_pos)
-                positions_range.append(coord)
-        # Y coord are changing and the difference between them is greater than 1
-        elif abs(prev_y_pos - next_y_pos) > 1:
-            start = min(prev_y_pos, next_y_pos) + 1
-            end = max(prev_y_pos, next_y_pos)
-            for y_position in range(start, end):
-                coord = (prev_x_pos, y_position)
-                positions_range.append(coord)
-        # Unique coordinates to add
-        if positions_range:
-            for position in positions_range:
-                if position not in player.positions:
-                    player.positions.append(position)
-
-    def create_player(self, number=2):
-        """Two players are always created. P1 is blue.
+    def create_simulation(self):
+        """Headless core that owns the light cycles, arena, and collision rules."""
+        if self.replay:
+            self.simulation = Simulation(self.width, self.height, self.replay.seed,
+                                         self.replay.inputs_per_tick,
+                                         trail_length=self.replay.trail_length)
+        elif self.remote:
+            # Only a mirror of the server's match, kept up to date by apply_frame
+            self.simulation = Simulation(self.width, self.height, self.remote.seed,
+                                         trail_length=self.remote.trail_length)
+        else:
+            self.simulation = Simulation(self.width, self.height, self.seed,
+                                         trail_length=self.trail_length)
+        self.simulation.profiler = self.profiler
+        # Only what the camera sees of an arena bigger than the window gets drawn
+        self.view = None
+        if self.width > self.view_width or self.height > self.view_height:
+            camera = Camera(self.view_width, self.view_height, self.simulation.x_boundary,
+                            self.simulation.y_boundary)
+            self.view = ArenaView(self.screen, camera, self.simulation.x_boundary,
+                                  self.simulation.y_boundary)
+
+    def create_player(self, number=None):
+        """Two players are always created, plus any bots. P1 is blue.
         P2 is Yellow, P3 is Red, P4 is Green"""
 
+        if number is None:
+            number = 2 + self.bots
+
         if number > 4:
             raise ValueError("No more than 4 players allowed.")
 
+        self.cycles = self.simulation.create_cycles(number)
         self.players = []
-        colors = ['#40BBE3','#E3E329', '#ff0000', '#33cc33']
-        
-        for i in range(number):
-            x, y = self.random_coord()
-            self.players.append(Player('P' + str(i + 1), x, y))
-            self.players[i].color(colors[i])
+
+        for i, cycle in enumerate(self.cycles):
+            self.players.append(self.pool.player(cycle, self.screen))
+            self.players[i].color(PLAYER_COLORS[i])
+            self.players[i].view = self.view
+
+        if self.record:
+            self.simulation.recorder = ReplayWriter(self.record, self.simulation, number)
 
     def create_particles(self):
-        """Creates particles list. All particles act in same manner."""
-        self.particles = []
-        # Number of particles
-        for i in range(20):
-            self.particles.append(Particle('square', 'white', 0, 0))
-
-    def particles_explode(self, player):
-        """Makes all particles explode at player crash position"""
-        for particle in self.particles:
-            particle.change_color(player)
-            particle.explode(player.xcor(), player.ycor())
-
-    def is_collision_with_enemy(self, player):
-        """Collision check with other player."""
-        # Get the current position, iterate through the positions list, and don't check its own
-        # positions, check if position is in list
-        for i in range(len(self.players)):
-            if player.name != self.players[i].name:
-                for position in player.positions[-5:]:
-                    if position in self.players[i].positions:
-                        return True
-
-    def is_collision_with_self(self, player):
-        for position in player.positions[-10:]: # Multiple positions to cover speed gap (0 - 3)
-            if position in player.positions[:-10]:
-                return True
-
-    def set_relative_keyboard_bindings(self):
-        """Maps relative controls to player movement."""
-        # Set P1 keyboard bindings
-        turtle.onkeypress(self.players[0].turn_left, 'a')
-        turtle.onkeypress(self.players[0].turn_right, 'd')
-        turtle.onkeypress(self.players[0].accelerate, 'w')
-        turtle.onkeypress(self.players[0].decelerate, 's')
-
-        # Set P2 keyboard bindings
-        turtle.onkeypress(self.players[1].turn_left, 'Left')
-        turtle.onkeypress(self.players[1].turn_right, 'Right')
-        turtle.onkeypress(self.players[1].accelerate, 'Up')
-        turtle.onkeypress(self.players[1].decelerate, 'Down')
-
-    def set_abs_keyboard_bindings(self):
-        """Maps absolute controls to player movement."""
-        
-        # Set P1 keyboard bindings
-        if self.players[0].heading() == 0: # East
-            self.abs_key_mapper(self.players[0], 'w', 's', 'd', 'a')
-        elif self.players[0].heading() == 90: # North
-            self.abs_key_mapper(self.players[0], 'a', 'd', 'w', 's')
-        elif self.players[0].heading() == 180: # West
-            self.abs_key_mapper(self.players[0], 's', 'w', 'a', 'd')
-        elif self.players[0].heading() == 270: # South
-            self.abs_key_mapper(self.players[0], 'd', 'a', 's', 'w')
-        # Set P2 keyboard bindings
-        if self.players[1].heading() == 0: # East
-            self.abs_key_mapper(self.players[1], 'Up', 'Down', 'Right', 'Left')
-        elif self.players[1].heading() == 90: # North
-            self.abs_key_mapper(self.players[1], 'Left', 'Right', 'Up', 'Down')
-        elif self.players[1].heading() == 180: # West
-            self.abs_key_mapper(self.players[1], 'Down', 'Up', 'Left', 'Right')
-        elif self.players[1].heading() == 270: # South
-            self.abs_key_mapper(self.players[1], 'Right', 'Left', 'Down', 'Up')            
-
-    def abs_key_mapper(self, player, left, right, accel, decel):
-        """Maps passed in args to player controls"""
-        turtle.onkeypress(player.turn_left, left)
-        turtle.onkeypress(player.turn_right, right)
-        turtle.onkeypress(player.accelerate, accel)
-        turtle.onkeypress(player.decelerate, decel)
+        """Creates the particle system and its renderer. There's room for every player
+        to explode at once. Headings come from the match seed, but from a separate
+        generator so the cosmetic effects never change the simulation."""
+        self.random = random.Random(self.simulation.seed)
+        self.particles = ParticleSystem(self.particles_per_crash * len(self.players))
+        self.particle_renderer = ParticleRenderer(self.screen, self.particles)
+        if self.view:
+            self.particle_renderer.camera = self.view.camera
+
+    def particles_explode(self, player, coord):
+        """Makes particles explode at player crash position"""
+        x, y = coord
+        headings = [self.random.randint(0, 360) for i in range(self.particles_per_crash)]
+        self.particles.explode(x, y, player.pencolor(), headings)
+
+    def create_controllers(self):
+        """The first two players use the keyboard and the rest are bots. Replays bring
+        their own input, so they get no controllers, and neither do networked matches,
+        where the server drives every light cycle."""
+        self.controllers = []
+        if self.replay or self.remote:
+            return
+        self.controllers = keyboard_controllers(self.simulation, self.relative_controls)
+        for cycle in self.cycles[len(self.controllers):]:
+            rng = random.Random(self.simulation.seed + cycle.number)
+            self.controllers.append(BotController(self.simulation, cycle, rng))
+
+    def set_keyboard_bindings(self):
+        """Maps relative or absolute controls to player movement, depending on the
+        menu setting. Keys are bound once and presses are queued for the next tick."""
+        self.keys.clear()
+        if self.remote:
+            bind_remote(self.keys, self.remote, self.relative_controls)
+        for controller in self.controllers:
+            if isinstance(controller, KeyboardController):
+                controller.bind(self.keys)
+        # Activate key mappings
+        self.keys.listen()
+
+    def create_hud(self):
+        self.hud = Hud(self.screen, self.view_width, self.view_height, self.cycles,
+                       self.hud_stats, self.profile_overlay)
 
     def draw_score(self):
-        """Using a turtle, this draws the score on the screen once, then clears once
-        the score changes. Start position is upper left corner. A dedicated score
-        pen is needed because the clear function is called every time the score
-        is updated."""
-        self.score_pen.clear()
-        self.score_pen.setposition((self.width / -2) + 75, (self.height / 2) - 40)
-        self.score_pen.pendown()
-        self.score_pen.color('white')
-        p1lives = 'P1: %s' % (self.players[0].lives * '*')
-        p2lives = 'P2: %s' % (self.players[1].lives * '*')
-        self.score_pen.write(p1lives, font=("Verdana", 18, "bold"))
-        self.score_pen.penup()
-        self.score_pen.hideturtle()
-        self.score_pen.setposition((self.width / -2) + 205, (self.height / 2) - 40)
-        self.score_pen.pendown()
-        self.score_pen.write(p2lives, font=("Verdana", 18, "bold"))
-        self.score_pen.penup()
-        self.score_pen.hideturtle()
-
-    def is_game_over(self):
-        """Checks to see if any player has run out of lives."""
-        for player in self.players:
-            if player.lives == 0:
-                return True
+        """Updates the lives shown for any player whose lives changed."""
+        self.hud.update_lives()
 
     def display_winner(self,):
         """Once game loop finishes, this runs to display the winner."""
         self.score_pen.setposition(0, 0)
         self.score_pen.pendown()
-        for player in self.players:
-            if player.lives > 0:
-                winner = player.name
-        self.score_pen.write(winner + ' wins!', align='center', font=("Verdana", 36, "bold"))
+        winner = self.simulation.winner()
+        if winner:
+            message = winner.name + ' wins!'
+        else:
+            message = 'Draw!'
+        self.score_pen.write(message, align='center', font=("Verdana", 36, "bold"))
 
     def reset_grid(self):
+        """Redraws every light cycle at the respawn point the simulation picked."""
+        if self.view:
+            self.view.clear()
         for player in self.players:
-            x, y = self.random_coord()
-            player.clear_lightcycle()
-            player.respawn(x, y)
+            player.respawn()
 
     def start_bgm(self):
-        if os.name == 'posix':
-            os.system('killall afplay')
-            os.system('afplay sounds/gameplay.m4a&')
-            os.system('say grid is live!')
+        self.audio.preload('sounds/explosion.wav', 'sounds/gameplay.m4a')
+        self.audio.stop()
+        self.audio.play('sounds/gameplay.m4a')
+        self.audio.say('grid is live!')
 
     def create_pens(self):
         """Self.pen is for the border and self.score_pen is naturally,for the score
         and winner."""
-        self.pen = turtle.Turtle()
-        self.score_pen = turtle.Turtle()
+        self.pen = self.pool.pen()
+        self.score_pen = self.pool.pen()
+        self.score_pen.hideturtle()
+        self.score_pen.penup()
 
     def create_assets(self):
         self.create_screen()
         self.create_pens()
+        self.create_simulation()
         self.draw_border()
-        self.create_player()
+        if self.replay:
+            self.create_player(self.replay.players)
+        elif self.remote:
+            self.create_player(self.remote.players)
+        else:
+            self.create_player()
         self.create_particles()
-        self.draw_score()
+        self.create_hud()
+        self.create_controllers()
+        self.set_keyboard_bindings()
         self.start_bgm()
         
-    def start_game(self):
-        """All players are set into motion, boundary checks, and collision checks
-        run continuously until a player runs out of lives."""
-        self.create_assets()
-        self.game_on = True
-         
-        while self.game_on:
-            # Updates screen only when loop is complete
-            turtle.update()
-            # Set controls based on menu setting
-            if self.relative_controls:
-                self.set_relative_keyboard_bindings()
-            else:
-                self.set_abs_keyboard_bindings()
-
-            # Activate key mappings
-            turtle.listen()
-            # Set players into motion and add converted coords to positions
+    def tick(self):
+        """One fixed simulation step: queued input, movement, collisions, and crash
+        handling."""
+        # Set players into motion, then let the renderers note any turns. Done every
+        # tick so the trail follows each turn; drawing waits for the next frame.
+        profiler = self.profiler
+        profiler.start()
+        if self.remote:
+            crashes = self.apply_frames()
+        elif self.replay:
+            crashes = self.simulation.step(self.replay.commands_for(self.simulation.ticks + 1))
+        else:
+            for controller in self.controllers:
+                command = controller.decide()
+                if command is not None:
+                    self.simulation.push_input(controller.cycle.number, command)
+            profiler.lap('controllers')
+            crashes = self.simulation.step()
+        if not crashes:
             for player in self.players:
-                player.forward(player.fd_speed)
-                player.convert_coord_to_int()
-                player.positions.append(player.coord)
-
-                # Detect collision with boundary, self, or enemy
-                if self.is_outside_boundary(player) or self.is_collision_with_enemy(player) or \
-                self.is_collision_with_self(player):
-                    player.lose_life()
-                # Add missing positions to bridge position gaps
-                if len(player.positions) > 1:
-                    self.position_range_adder(player)
-
-            # Particle movement
-            for particle in self.particles:
-                particle.move()
-
-            # If a player crashes, particles explode and reset lightcycles
+                player.sync()
+            profiler.lap('trail sync')
+
+        # Particle movement
+        self.particles.step()
+        profiler.lap('particles')
+
+        # If a player crashes, particles explode and reset lightcycles
+        if crashes:
+            for cycle, coord in crashes:
+                self.particles_explode(self.players[cycle.number - 1], coord)
+            self.audio.play('sounds/explosion.wav')
+            self.reset_grid()
+            self.draw_score()
+            profiler.lap('crash')
+
+        if self.simulation.is_game_over():
+            self.game_on = False
+        elif self.replay and self.replay.is_finished(self.simulation.ticks):
+            self.game_on = False
+        elif self.remote and self.remote.closed and self.remote.frames.empty():
+            self.game_on = False
+
+    def apply_frames(self):
+        """Applies every frame the server has sent since the last tick, stopping
+        after a crash so it's shown before the grid moves on."""
+        from net import apply_frame
+        while True:
+            frame = self.remote.next_frame()
+            if frame is None:
+                return []
+            crashes = apply_frame(self.simulation, frame)
+            if crashes:
+                return crashes
             for player in self.players:
-                if player.status == player.CRASHED:
-                    self.particles_explode(player)
-                    if os.name == 'posix':
-                        os.system('afplay sounds/explosion.wav&')
-                    self.reset_grid()
-                    self.draw_score()
-        
-            if self.is_game_over():
-                self.game_on = False
+                player.sync()
+
+    def render(self, alpha):
+        """Pushes everything drawn since the last frame to the screen."""
+        profiler = self.profiler
+        profiler.start()
+        if self.view:
+            # Follow the local player: your own cycle when networked, otherwise P1
+            number = self.remote.number if self.remote else 1
+            self.view.camera.follow(self.cycles[number - 1].coord)
+        for player in self.players:
+            player.draw()
+        if self.view:
+            # After the players, so runs they just finished are drawn this frame
+            self.view.draw()
+        profiler.lap('draw trails')
+        self.particle_renderer.draw()
+        profiler.lap('draw particles')
+        if self.hud_stats:
+            self.hud.update_stats(self.clock.ticks, self.update_timer)
+        if self.profile_overlay:
+            self.hud.update_profile(self.profiler)
+        profiler.lap('hud')
+        start = time.perf_counter()
+        turtle.update()
+        profiler.lap('turtle.update')
+        if self.update_timer.add(time.perf_counter() - start) and self.render_stats:
+            window, average, longest = self.update_timer.last_report
+            print('turtle.update() window {}: {:.2f} ms avg, {:.2f} ms max, {} canvas items'.format(
+                window, average, longest, len(self.screen.getcanvas().find_all())))
 
-        # Game ends
+    def start_game(self):
+        """Plays a match on its own, shows the winner for two seconds, and cleans up.
+        The process is about to exit, so the audio worker is shut down and waited
+        for rather than just asked to stop; otherwise the music could outlive us."""
+        self.play()
         self.display_winner()
+        turtle.update()
         time.sleep(2)
-        self.screen.clear()
-        if os.name == 'posix':
-            os.system('killall afplay')
+        self.release()
+        self.audio.close()
 
+    def play(self):
+        """All players are set into motion, boundary checks, and collision checks
+        run at a fixed tick rate until a player runs out of lives."""
+        self.create_assets()
+        self.game_on = True
+        self.clock = FrameClock(self.tick_rate, self.fps)
+        self.clock.run(self.tick, self.render, lambda: self.game_on)
 
-class Player(turtle.Turtle):
+        # Game ends
+        if self.simulation.recorder:
+            self.simulation.recorder.close()
+        if self.replay:
+            self.replay.close()
+        if self.remote:
+            self.remote.close()
+        if self.profiler:
+            self.profiler.dump()
+
+    def release(self):
+        """Takes everything this match drew off the screen and hands the turtles back
+        to the pool. The screen itself is left alone so it can be reused."""
+        self.audio.stop()
+        self.keys.clear()
+        for player in self.players:
+            self.pool.release_player(player)
+        self.pool.release_pen(self.pen)
+        self.pool.release_pen(self.score_pen)
+        self.hud.remove()
+        self.particle_renderer.remove()
+        if self.view:
+            self.view.remove()
+        self.players = []
 
-    CRASHED = 'crashed'
-    READY = 'ready'
 
-    def __init__(self, name, start_x, start_y):
+class Player(turtle.Turtle):
+    """Draws a light cycle and its trail. All game state lives in the simulation's
+    Cycle; the turtle is just the light cycle's head. The trail is drawn straight
+    onto the canvas with one line per straight run, so a round adds one canvas
+    item per turn rather than one per step. When the trail has a length limit, the
+    oldest run is cut back to the trail's oldest cell every frame and deleted once
+    it's empty, so the item count stays bounded however long the round goes on."""
+
+    def __init__(self, cycle, screen):
         super(Player, self).__init__()
-        self.name = name
+        self.canvas = screen.getcanvas()
         self.speed(0)
-        self.fd_speed = 1
         self.pensize(2)
-        self.start_x = start_x
-        self.start_y = start_y
-        self.setposition(start_x, start_y)
-        self.positions = []
-        self.coord = (self.start_x, self.start_y)
-        self.lives = 5
-        self.status = self.READY
-
-    def turn_left(self):
-        """90 Degree left turn."""
-        self.left(90)
-
-    def turn_right(self):
-        """90 Degree right turn."""
-        self.right(90)
-
-    def accelerate(self):
-        """Min. speed = 1, Max. speed = 3."""
-        if self.fd_speed < 3:
-            self.fd_speed += 1
-            self.forward(self.fd_speed) # Needs to be run only if speed changes
-
-    def decelerate(self):
-        """Min. speed = 1, therefore player can never stop"""
-        if self.fd_speed > 1:
-            self.fd_speed -= 1
-            self.forward(self.fd_speed) # Needs to be run only if speed changes
-
-    def convert_coord_to_int(self):
-        """Convert coordinates to integers for more accurate collision detection"""
-        x, y = self.pos()
-        x = int(x)
-        y = int(y)
-        self.coord = (x, y)
+        self.penup()
+        self.view = None # ArenaView of a big arena, which takes over finished runs
+        self.attach(cycle)
+
+    def attach(self, cycle):
+        """Starts drawing cycle, whether the turtle is new or reused from the pool."""
+        self.cycle = cycle
+        self.name = cycle.name
+        self.trail_items = deque()
+        self.live_item = None # Current run's line when drawing through a view
+        self.start_run()
+        self.showturtle()
+        self.draw()
+
+    def start_run(self):
+        """Begins a new straight run at the cycle's position."""
+        self.run_heading = self.cycle.heading
+        self.run_start = self.cycle.coord
+        self.run_item = None
+        self.last = self.cycle.coord
+        # The trail's added count when it reached last, i.e. last's place among the
+        # cells added this round
+        self.last_added = self.cycle.positions.added
+        self.finished_runs = [] # Runs ended by a turn since the last draw
+        # Drawn runs of a bounded trail as [start, end, item or view index, added
+        # count at end], oldest first, so they can be trimmed
+        self.runs = deque()
+
+    def sync(self):
+        """Called every tick. Notes where the light cycle turned; nothing is drawn."""
+        if self.cycle.heading != self.run_heading:
+            self.finished_runs.append((self.run_start, self.last, self.run_item,
+                                       self.last_added))
+            self.run_heading = self.cycle.heading
+            self.run_start = self.last
+            self.run_item = None
+        self.last = self.cycle.coord
+        self.last_added = self.cycle.positions.added
+
+    def draw(self):
+        """Draws the runs finished since the last frame, stretches the current one,
+        and moves the head."""
+        if self.view:
+            self.draw_through_view()
+            return
+        bounded = self.cycle.positions.capacity
+        for start, end, item, added in self.finished_runs:
+            item = self.draw_run(start, end, item)
+            if bounded:
+                self.runs.append([start, end, item, added])
+        self.finished_runs = []
+        if bounded:
+            self.trim()
+        self.run_item = self.draw_run(self.run_start, self.last, self.run_item)
+        self.setheading(self.run_heading)
+        self.setposition(self.last)
+
+    def draw_through_view(self):
+        """Big arena: finished runs are handed to the view, which draws whichever
+        are on screen. Only the current run and the head are drawn here, shifted by
+        the camera."""
+        bounded = self.cycle.positions.capacity
+        for start, end, item, added in self.finished_runs:
+            index = self.view.add_run(start, end, self.pencolor())
+            if bounded:
+                self.runs.append([start, end, index, added])
+        self.finished_runs = []
+        if bounded:
+            self.trim()
+        camera = self.view.camera
+        start = (self.run_start[0] - camera.x, self.run_start[1] - camera.y)
+        last = (self.last[0] - camera.x, self.last[1] - camera.y)
+        if start != last or self.live_item is not None:
+            coords = (start[0], -start[1], last[0], -last[1])
+            if self.live_item is None:
+                self.live_item = self.canvas.create_line(*coords, fill=self.pencolor(), width=2,
+                                                         capstyle='projecting')
+                self.trail_items.append(self.live_item)
+            else:
+                self.canvas.coords(self.live_item, *coords)
+        self.setheading(self.run_heading)
+        self.setposition(last)
+
+    def draw_run(self, start, end, item):
+        """Creates or stretches the line item for one run. Turtle's y axis points up,
+        the canvas's points down."""
+        if start == end and item is None:
+            return None
+        coords = (start[0], -start[1], end[0], -end[1])
+        if item is None:
+            item = self.canvas.create_line(*coords, fill=self.pencolor(), width=2,
+                                           capstyle='projecting')
+            self.trail_items.append(item)
+        else:
+            self.canvas.coords(item, *coords)
+        return item
+
+    def trim(self):
+        """Cuts the drawn runs back to the trail's oldest cell once the trail has
+        started losing cells. A run whose cells are all gone is removed; the cell a
+        run shares with the next one, at the turn, belongs to the next one. Runs go
+        by how many cells the trail has lost, not by where its tail is, since a
+        trail that loops back can have its tail on an old run's line."""
+        trail = self.cycle.positions
+        if not len(trail) or trail.added <= trail.capacity:
+            return
+        # Place of the oldest cell still in the trail among the cells added
+        oldest = trail.added - len(trail) + 1
+        runs = self.runs
+        while runs and runs[0][3] <= oldest:
+            self.remove_run(runs.popleft())
+        tail = trail[0]
+        if not runs:
+            # Down to the current run, which is drawn from run_start
+            self.run_start = tail
+        elif runs[0][0] != tail:
+            run = runs[0]
+            run[0] = tail
+            if self.view:
+                self.view.remove_run(run[2])
+                run[2] = self.view.add_run(tail, run[1], self.pencolor())
+            else:
+                run[2] = self.draw_run(tail, run[1], run[2])
+
+    def remove_run(self, run):
+        start, end, item, added = run
+        if self.view:
+            self.view.remove_run(item)
+        elif item is not None:
+            self.canvas.delete(item)
+            self.trail_items.remove(item)
 
     def clear_lightcycle(self):
         """Removes light cycle from screen"""
-        self.penup()
-        self.clear()
-
-    def lose_life(self):
-        """Takes away one life from player"""
-        self.lives -= 1
-        self.status = self.CRASHED
-
-    def respawn(self, x, y):
-        """Respawns light cycle to random coord passed as args, resets speed to 1, and
-        resets the position list."""
-        self.status = self.READY
-        self.setposition(x, y)
-        self.setheading(random.randrange(0, 360, 90))
-        self.fd_speed = 1
-        self.pendown()
-        self.positions = []
-
-class Particle(turtle.Turtle):
-    """This class is only used to create particle effects when there is a crash."""
-    def __init__(self, spriteshape, color, start_x, start_y):
-        turtle.Turtle.__init__(self, shape = spriteshape)
-        self.shapesize(stretch_wid=.1, stretch_len=.3, outline=None)
-        self.speed(0) # Refers to animation speed
-        self.penup()
-        self.color(color)
-        self.fd_speed = 10
-        self.hideturtle()
-        self.frame = 0
+        if self.trail_items:
+            self.canvas.delete(*self.trail_items)
+        self.trail_items = deque()
+        self.live_item = None
+
+    def respawn(self):
+        """Clears the trail and jumps to the cycle's respawn coord."""
+        self.clear_lightcycle()
+        self.start_run()
+        self.draw()
+
+class TurtlePool(object):
+    """Turtles handed back at the end of a match, ready for the next one. A session
+    running match after match only ever creates as many turtles as one match needs."""
+
+    def __init__(self):
+        self.pens = []
+        self.players = []
+
+    def pen(self):
+        """A plain turtle in its default state."""
+        if self.pens:
+            pen = self.pens.pop()
+            pen.reset()
+            return pen
+        return turtle.Turtle()
+
+    def player(self, cycle, screen):
+        if self.players:
+            player = self.players.pop()
+            player.attach(cycle)
+            return player
+        return Player(cycle, screen)
+
+    def release_pen(self, pen):
+        pen.clear()
+        pen.hideturtle()
+        self.pens.append(pen)
+
+    def release_player(self, player):
+        player.clear_lightcycle()
+        player.hideturtle()
+        player.view = None
+        self.players.append(player)
+
+
+class Hud(object):
+    """Score display across the top of the screen. Every label is one canvas text
+    item created up front; updates only touch the labels whose text changed."""
+
+    FONT = ("Verdana", 18, "bold")
+    STATS_FONT = ("Verdana", 10, "normal")
+    SPACING = 130 # Pixels between player labels
+    STATS_EVERY = 1.0 # Seconds between stats refreshes
+
+    def __init__(self, screen, width, height, cycles, show_stats=False, show_profile=False):
+        self.canvas = screen.getcanvas()
+        self.cycles = cycles
+        self.lives = [None] * len(cycles)
+        self.labels = []
+        # Start position is upper left corner. Turtle's y axis points up, the canvas's
+        # points down.
+        x = (width / -2) + 75
+        y = -((height / 2) - 40)
+        for i in range(len(cycles)):
+            self.labels.append(self.canvas.create_text(x + i * self.SPACING, y, anchor='sw',
+                                                       fill='white', font=self.FONT))
+        self.stats_item = None
+        if show_stats:
+            self.stats_item = self.canvas.create_text((width / 2) - 55, y, anchor='se',
+                                                      fill='white', font=self.STATS_FONT)
+        self.stats_text = None
+        self.stats_time = time.perf_counter()
+        self.stats_ticks = 0
+        self.profile_item = None
+        if show_profile:
+            self.profile_item = self.canvas.create_text((width / -2) + 60, (height / 2) - 60,
+                                                        anchor='sw', fill='white',
+                                                        font=('Courier', 10, 'normal'))
+        self.profile_time = self.stats_time
+        self.update_lives()
+
+    def remove(self):
+        """Deletes every label from the canvas."""
+        items = self.labels + [item for item in (self.stats_item, self.profile_item) if item]
+        self.canvas.delete(*items)
+
+    def update_lives(self):
+        for i, cycle in enumerate(self.cycles):
+            if cycle.lives != self.lives[i]:
+                self.lives[i] = cycle.lives
+                text = '%s: %s' % (cycle.name, max(cycle.lives, 0) * '*')
+                self.canvas.itemconfigure(self.labels[i], text=text)
+
+    def update_stats(self, ticks, update_timer):
+        """Refreshes the stats label about once a second: ticks per second since the
+        last refresh, the latest turtle.update() timing, and each trail length."""
+        now = time.perf_counter()
+        if self.stats_item is None or now - self.stats_time < self.STATS_EVERY:
+            return
+        tick_rate = (ticks - self.stats_ticks) / (now - self.stats_time)
+        self.stats_time = now
+        self.stats_ticks = ticks
+        frame_time = ''
+        if update_timer.last_report:
+            frame_time = '  frame %.1f ms' % update_timer.last_report[1]
+        trails = ' '.join(str(len(cycle.positions)) for cycle in self.cycles)
+        text = '%d ticks/s%s  trails %s' % (tick_rate, frame_time, trails)
+        if text != self.stats_text:
+            self.stats_text = text
+            self.canvas.itemconfigure(self.stats_item, text=text)
+
+    def update_profile(self, profiler):
+        """Refreshes the profiler overlay in the lower left about once a second."""
+        now = time.perf_counter()
+        if self.profile_item is None or now - self.profile_time < self.STATS_EVERY:
+            return
+        self.profile_time = now
+        lines = ['%-15s %7s %7s' % ('phase', 'p50 ms', 'p99 ms')]
+        for phase, count, p50, p99, longest in profiler.report():
+            lines.append('%-15s %7.3f %7.3f' % (phase, p50, p99))
+        self.canvas.itemconfigure(self.profile_item, text='\n'.join(lines))
+
+
+class Camera(object):
+    """The part of a big arena shown in the window: a view centred on a light cycle
+    as far as the walls allow, stopping 50 pixels past the border like the fixed
+    size screens."""
+
+    def __init__(self, width, height, x_boundary, y_boundary):
+        self.width = width
+        self.height = height
+        self.x_limit = max(x_boundary + 50 - width / 2, 0)
+        self.y_limit = max(y_boundary + 50 - height / 2, 0)
+        self.x = 0
+        self.y = 0
+
+    def follow(self, coord):
+        self.x = min(max(coord[0], -self.x_limit), self.x_limit)
+        self.y = min(max(coord[1], -self.y_limit), self.y_limit)
+
+    def bounds(self):
+        """Left, bottom, right, and top of the view in arena coordinates."""
+        return (self.x - self.width / 2, self.y - self.height / 2,
+                self.x + self.width / 2, self.y + self.height / 2)
+
+
+class ArenaView(object):
+    """Draws a big arena's border and finished trail runs through a camera. Runs are
+    filed in square buckets of the arena, and each frame only the runs in buckets
+    the view overlaps are drawn, on a pool of canvas line items, so the cost
+    follows what's on screen rather than how long the trails are. Runs trimmed off
+    a bounded trail are taken out of their buckets, and their slots reused."""
+
+    BUCKET = 256 # Cells along each side of a bucket
+
+    def __init__(self, screen, camera, x_boundary, y_boundary):
+        self.canvas = screen.getcanvas()
+        self.camera = camera
+        self.x_boundary = x_boundary
+        self.y_boundary = y_boundary
+        self.border = self.canvas.create_rectangle(0, 0, 0, 0, outline='blue', width=3)
+        self.runs = [] # (left, bottom, right, top, color), or None once removed
+        self.free = [] # Indexes of removed runs, for add_run to reuse
+        self.buckets = {} # (bucket x, bucket y) -> indexes into runs
+        self.edits = 0 # Runs added or removed, so draw() can tell nothing changed
+        self.items = [] # Line pool; the first shown of them are in use
+        self.colors = []
+        self.shown = 0
+        self.drawn_at = None # Camera position and edit count of the last draw
+
+    def add_run(self, start, end, color):
+        """Files a finished run. Returns its index, for remove_run."""
+        left, right = min(start[0], end[0]), max(start[0], end[0])
+        bottom, top = min(start[1], end[1]), max(start[1], end[1])
+        run = (left, bottom, right, top, color)
+        if self.free:
+            index = self.free.pop()
+            self.runs[index] = run
+        else:
+            index = len(self.runs)
+            self.runs.append(run)
+        for key in self.run_buckets(run):
+            self.buckets.setdefault(key, []).append(index)
+        self.edits += 1
+        return index
+
+    def remove_run(self, index):
+        for key in self.run_buckets(self.runs[index]):
+            self.buckets[key].remove(index)
+        self.runs[index] = None
+        self.free.append(index)
+        self.edits += 1
+
+    def run_buckets(self, run):
+        left, bottom, right, top, color = run
+        size = self.BUCKET
+        for bucket_x in range(left // size, right // size + 1):
+            for bucket_y in range(bottom // size, top // size + 1):
+                yield (bucket_x, bucket_y)
+
+    def clear(self):
+        self.runs = []
+        self.free = []
+        self.buckets = {}
+        self.drawn_at = None
+
+    def draw(self):
+        camera = self.camera
+        if self.drawn_at == (camera.x, camera.y, self.edits):
+            return
+        self.drawn_at = (camera.x, camera.y, self.edits)
+        left, bottom, right, top = camera.bounds()
+        shift_x, shift_y = camera.x, camera.y
+        canvas = self.canvas
+        canvas.coords(self.border, -self.x_boundary - shift_x, shift_y - self.y_boundary,
+                      self.x_boundary - shift_x, shift_y + self.y_boundary)
+        visible = set()
+        size = self.BUCKET
+        for bucket_x in range(int(left // size), int(right // size) + 1):
+            for bucket_y in range(int(bottom // size), int(top // size) + 1):
+                visible.update(self.buckets.get((bucket_x, bucket_y), ()))
+        used = 0
+        for index in visible:
+            x0, y0, x1, y1, color = self.runs[index]
+            if x1 < left or x0 > right or y1 < bottom or y0 > top:
+                continue
+            if used == len(self.items):
+                self.items.append(canvas.create_line(0, 0, 0, 0, width=2,
+                                                     capstyle='projecting'))
+                self.colors.append(None)
+            item = self.items[used]
+            # Turtle's y axis points up, the canvas's points down
+            canvas.coords(item, x0 - shift_x, shift_y - y0, x1 - shift_x, shift_y - y1)
+            if self.colors[used] != color:
+                self.colors[used] = color
+                canvas.itemconfigure(item, fill=color)
+            if used >= self.shown:
+                canvas.itemconfigure(item, state='normal')
+            used += 1
+        for item in self.items[used:self.shown]:
+            canvas.itemconfigure(item, state='hidden')
+        self.shown = used
+
+    def remove(self):
+        self.canvas.delete(self.border, *self.items)
+
+
+class ParticleRenderer(object):
+    """Draws a ParticleSystem with a fixed pool of canvas line items, one per slot.
+    Each frame only moves the live particles and hides the ones that just expired,
+    instead of driving a turtle per particle."""
+
+    LENGTH = 0.6 # Fraction of a tick's movement drawn as the streak
+
+    def __init__(self, screen, particles):
+        self.canvas = screen.getcanvas()
+        self.particles = particles
+        self.camera = None # Set for big arenas, whose particles are drawn shifted
+        self.items = []
+        self.visible = [False] * particles.capacity
+        self.colors = [None] * particles.capacity
+        for i in range(particles.capacity):
+            self.items.append(self.canvas.create_line(0, 0, 0, 0, width=2, state='hidden'))
+
+    def remove(self):
+        self.canvas.delete(*self.items)
+
+    def draw(self):
+        particles = self.particles
+        shift_x = shift_y = 0
+        if self.camera:
+            shift_x, shift_y = self.camera.x, self.camera.y
+        for i, item in enumerate(self.items):
+            if particles.life[i] > 0:
+                # Turtle's y axis points up, the canvas's points down
+                x, y = particles.x[i] - shift_x, shift_y - particles.y[i]
+                self.canvas.coords(item, x, y, x + particles.dx[i] * self.LENGTH,
+                                   y - particles.dy[i] * self.LENGTH)
+                if self.colors[i] != particles.colors[i]:
+                    self.colors[i] = particles.colors[i]
+                    self.canvas.itemconfigure(item, fill=self.colors[i])
+                if not self.visible[i]:
+                    self.visible[i] = True
+                    self.canvas.itemconfigure(item, state='normal')
+            elif self.visible[i]:
+                self.visible[i] = False
+                self.canvas.itemconfigure(item, state='hidden')
 
-    def explode(self, start_x, start_y):
-        self.frame = 1
-        self.showturtle()
-        self.setposition(start_x, start_y)
-        self.setheading(random.randint(0, 360))
-
-    def move(self):
-        if self.frame > 0:
-            self.forward(self.fd_speed)
-            self.frame += 1
-        if self.frame > 10:
-            self.frame = 0
-            self.hideturtle()
-            self.setposition(0, 0)
-
-    def change_color(self, player):
-        pencolor, fillcolor = player.color()
-        self.color(pencolor)
 
 if __name__ == '__main__':
-    gameObj = Game()
-    gameObj.start_game()
+    parser = argparse.ArgumentParser(description='TurtleTron')
+    parser.add_argument('--headless', action='store_true',
+                        help='play matches without a display and print results as JSON lines')
+    parser.add_argument('--profile', action='store_true',
+                        help='time each phase of the game loop and print p50/p99/max at the end')
+    parser.add_argument('--serve', action='store_true',
+                        help='host a networked match for up to 4 players')
+    parser.add_argument('--connect', action='store_true',
+                        help='join the networked match at --host and --port')
+    import headless
+    import net
+    import raster
+    headless.add_arguments(parser)
+    net.add_arguments(parser)
+    raster.add_arguments(parser)
+    args = parser.parse_args()
+    headless.check_arguments(parser, args)
+    if args.headless:
+        headless.main(args)
+    elif args.render:
+        raster.main(args)
+    elif args.serve:
+        net.main(args)
+    elif args.connect:
+        gameObj = Game(connect=(args.host, args.port), profile=args.profile)
+        gameObj.start_game()
+    else:
+        gameObj = Game(profile=args.profile, trail_length=args.trail_length)
+        gameObj.start_game()
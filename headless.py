@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import random
+import multiprocessing
+from simulation import Simulation, GRID_SIZES
+from controllers import CONTROLLERS, BotController
+
+
+def run_match(match, seed, width, height, players=2, controller='avoid', max_ticks=100000,
+              max_speed=3, trail_length=None):
+    """Plays one full match without a display, every light cycle driven by the named
+    controller. Returns the result as a dict."""
+    simulation = Simulation(width, height, seed, max_speed=max_speed, trail_length=trail_length)
+    simulation.create_cycles(players)
+    kind = CONTROLLERS[controller]
+    options = {}
+    if issubclass(kind, BotController):
+        # No wall-clock budget, so a seed plays out the same way on any machine
+        options['budget'] = None
+    controllers = []
+    for cycle in simulation.cycles:
+        rng = random.Random((seed * 31) + cycle.number)
+        controllers.append(kind(simulation, cycle, rng, **options))
+
+    crashes = []
+    while not simulation.is_game_over() and simulation.ticks < max_ticks:
+        for each in controllers:
+            command = each.decide()
+            if command is not None:
+                simulation.push_input(each.cycle.number, command)
+        for cycle, coord in simulation.step():
+            crashes.append({'tick': simulation.ticks, 'player': cycle.name,
+                            'cause': cycle.crash_cause, 'coord': coord})
+
+    winner = simulation.winner()
+    return {
+        'match': match,
+        'seed': seed,
+        'grid': [width, height],
+        'winner': winner.name if winner else None,
+        'lives': dict((cycle.name, cycle.lives) for cycle in simulation.cycles),
+        'ticks': simulation.ticks,
+        'crashes': crashes,
+    }
+
+
+def run_match_args(args):
+    return run_match(*args)
+
+
+def run_batch(matches, workers=None, grid='medium', players=2, controller='avoid',
+              seed=0, max_ticks=100000, max_speed=3, trail_length=None, output=sys.stdout):
+    """Runs matches across a process pool and writes one JSON line per finished
+    match to output as results come in. Match i uses seed + i."""
+    width, height = GRID_SIZES[grid]
+    jobs = [(i, seed + i, width, height, players, controller, max_ticks, max_speed, trail_length)
+            for i in range(matches)]
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap_unordered(run_match_args, jobs):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+
+def add_arguments(parser):
+    parser.add_argument('--matches', type=int, default=1, help='number of matches to play')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--grid', choices=sorted(GRID_SIZES), default='medium')
+    parser.add_argument('--players', type=int, default=2)
+    parser.add_argument('--controller', choices=sorted(CONTROLLERS), default='avoid')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed of the first match (default 0, or random for a '
+                             'networked match)')
+    parser.add_argument('--max-ticks', type=int, default=100000,
+                        help='stop a match that runs longer than this')
+    parser.add_argument('--max-speed', type=int, default=3,
+                        help='top speed in cells per tick')
+    parser.add_argument('--trail-length', type=int, default=None,
+                        help='longest a trail gets before its oldest cells disappear; '
+                             'no shorter than --max-speed')
+
+
+def check_arguments(parser, args):
+    """Rejects option values argparse can't check on its own."""
+    top_speed = max(args.max_speed, 1)
+    if args.trail_length is not None and args.trail_length < top_speed:
+        parser.error('--trail-length must be at least the top speed ({})'.format(top_speed))
+
+
+def main(args):
+    seed = args.seed
+    if seed is None:
+        seed = 0
+    run_batch(args.matches, args.workers, args.grid, args.players, args.controller,
+              seed, args.max_ticks, args.max_speed, args.trail_length)
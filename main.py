@@ -1,29 +1,64 @@
 #!/usr/bin/env python3
 
+import time
+STARTED = time.perf_counter() # Before the imports, for --startup-stats
+
 import turtle
-import os
 import sys
+import argparse
 import game
+import replay
+import audio
+import assets
+from clock import FrameClock
+from controls import KeyDispatcher
+from simulation import GRID_SIZES, Cycle
+
+IMPORTED = time.perf_counter()
 
 class MainMenu(object):
     """Main menu creates a 800 x 600 window to allow you to view the controls,
     change the grid size, start the game, and quit the game.
+
+    The whole session is one flat loop over scenes (current_screen): the menu
+    screens, then 'match', 'results', and back to 'main', until 'quit'. Key
+    handlers only switch scenes; the loop does the work, so nothing nests however
+    many matches are played. The screen, the cursor, the key bindings, and the
+    match turtles (through a pool) are created once and reused.
     """
 
-    game_on = False
-    
-    def __init__(self):
+    # The menu only moves a cursor, so it doesn't need the game's frame rate
+    MENU_FPS = 30
+    MENU_KEYS = ['Up', 'w', 'Down', 's', 'Right', 'd', 'Left', 'a', 'Return', 'space']
+    MENU_SCREENS = ('main', 'controls', 'grid_size', 'results')
+    RESULTS_TIME = 2 # Seconds the winner is shown before returning to the menu
+
+    def __init__(self, startup_stats=False, arena=None, **game_options):
         self.current_screen = 'main'
+        # Grid size played whatever is picked on the grid size screen, e.g. 'huge'
+        self.arena = arena
+        # Passed through to every game.Game
+        self.game_options = game_options
+        self.audio = audio.get_manager()
+        # Menu images are read ahead while the window opens
+        self.backdrop = assets.get_backdrop()
+        self.backdrop.preload()
+        # Print import time and time to the first menu frame
+        self.startup_stats = startup_stats
         self.relative_controls = False
+        self.keys = KeyDispatcher()
+        self.pool = game.TurtlePool()
+        self.game = None
+        self.grid = None # Width and height picked for the next match
+        self.results_until = 0
         self.keyboard_bindings()
 
     def create_screen(self):
         """Create medium sized main menu."""
-        self.current_screen == 'main'
         self.width, self.height = (800, 600)
         self.screen = turtle.Screen()
         self.screen.bgcolor('black')
-        self.screen.bgpic('images/main_menu.gif')
+        self.backdrop.show(self.screen, 'main_menu')
         self.screen.setup(self.width, self.height, startx=None, starty=None)
         self.screen.title('TURTLETRON')
         self.screen.tracer(0)
@@ -38,6 +73,8 @@ class MainMenu(object):
             self.set_cursor_grid_size()
         elif self.current_screen == 'controls':
             self.set_cursor_controls()
+        elif self.current_screen == 'results' and time.perf_counter() >= self.results_until:
+            self.display_main()
 
     def set_cursor_main(self):
         """Main: Start = 3, Controls = 2, Quit = 1"""
@@ -56,7 +93,6 @@ class MainMenu(object):
             self.pen.setposition(145, -215)
         self.display_controls()
 
-
     def set_cursor_grid_size(self):
         """Grid Size: Small = 1, Medium = 2, Large = 3"""
         if self.pen.cursor_pos == 1:
@@ -79,24 +115,25 @@ class MainMenu(object):
             self.pen.cursor_pos -= 1
 
     def keyboard_bindings(self):
-        """Sets bindings depending on which screen is displayed. Either player
-        can control cursor.
+        """Sets key actions depending on which screen is displayed. Either player
+        can control cursor. Only the action table changes here; the keys are bound
+        to Tk once in start_menu.
         """
-        turtle.listen()
+        self.keys.clear()
         if self.current_screen == 'main':
-            turtle.onkeypress(self.cursor_up, 'Up')
-            turtle.onkeypress(self.cursor_up, 'w')
-            turtle.onkeypress(self.cursor_down, 'Down')
-            turtle.onkeypress(self.cursor_down, 's')
+            self.keys.set_action('Up', self.cursor_up)
+            self.keys.set_action('w', self.cursor_up)
+            self.keys.set_action('Down', self.cursor_down)
+            self.keys.set_action('s', self.cursor_down)
         elif (self.current_screen == 'grid_size' or
               self.current_screen == 'controls'):
-            turtle.onkeypress(self.cursor_up, 'Right')
-            turtle.onkeypress(self.cursor_up, 'd')
-            turtle.onkeypress(self.cursor_down, 'Left')
-            turtle.onkeypress(self.cursor_down, 'a')
+            self.keys.set_action('Right', self.cursor_up)
+            self.keys.set_action('d', self.cursor_up)
+            self.keys.set_action('Left', self.cursor_down)
+            self.keys.set_action('a', self.cursor_down)
         # Apply special function to return or space
-        turtle.onkeypress(self.press_enter_or_space_master, 'Return')
-        turtle.onkeypress(self.press_enter_or_space_master, 'space')
+        self.keys.set_action('Return', self.press_enter_or_space_master)
+        self.keys.set_action('space', self.press_enter_or_space_master)
 
     def press_enter_or_space_master(self):
         """Depending on the current screen,
@@ -108,6 +145,8 @@ class MainMenu(object):
             self.press_enter_or_space_grid_size()
         elif self.current_screen == 'controls':
             self.press_enter_or_space_controls()
+        elif self.current_screen == 'results':
+            self.display_main()
 
     def press_enter_or_space_main(self):
         """Controls how enter or space function depending on the cursor position
@@ -123,9 +162,8 @@ class MainMenu(object):
             else:
                 self.pen.cursor_pos = 2
         elif self.pen.cursor_pos == 1:
-            if os.name == 'posix':
-                os.system('killall afplay')
-            turtle.bye()
+            self.current_screen = 'quit'
+
 
     def press_enter_or_space_controls(self):
         """Controls how enter or space function depending on the cursor position
@@ -143,73 +181,150 @@ class MainMenu(object):
         for the grid size screen.
         """
         if self.pen.cursor_pos == 1:
-            width, height = (640, 480)
+            self.grid = (640, 480)
         elif self.pen.cursor_pos == 2:
-            width, height = (800, 600)
-        elif self.pen.cursor_pos == 3:
-            width, height = (1024, 768)
+            self.grid = (800, 600)
         else:
-            pass
-        self.screen.clear()
-        self.pen.clear()
-        if os.name == 'posix':
-            os.system('killall afplay')
-        self.game_on = True
-        # Start game
-        self.start_game(width, height)
-        # Game finishes and returns to menu
-        self.current_screen = 'main'
-        menu.start_menu()
+            self.grid = (1024, 768)
+        if self.arena:
+            self.grid = GRID_SIZES[self.arena]
+        # The session loop starts the match once this key press is handled
+        self.current_screen = 'match'
 
     def display_controls(self):
         """Displays control screen. User can choose between relative or absolute
         control scheme.
         """
-        self.current_screen = 'controls'
+        if self.current_screen != 'controls':
+            self.current_screen = 'controls'
+            self.keyboard_bindings()
         if self.pen.cursor_pos == 1:
-            self.screen.bgpic('images/controls_relative.gif')
+            self.backdrop.show(self.screen, 'controls_relative')
         else:
-            self.screen.bgpic('images/controls_absolute.gif')
+            self.backdrop.show(self.screen, 'controls_absolute')
 
     def display_main(self):
-        """Displays the main menu."""
+        """Displays the main menu. Coming back from a match, the match is cleared away
+        first and the menu music restarts."""
+        if self.game:
+            self.game.release()
+            self.game = None
+            self.pen.cursor_pos = 3
+            self.create_screen()
+            self.audio.play('sounds/main_menu.m4a')
         self.current_screen = 'main'
-        self.screen.bgpic('images/main_menu.gif')
+        self.keyboard_bindings()
+        self.backdrop.show(self.screen, 'main_menu')
         self.pen.showturtle()
 
     def display_grid_options(self):
         """Displays grid size options, after selecting to start."""
         self.pen.cursor_pos = 2
         self.current_screen = 'grid_size'
-        self.screen.bgpic('images/grid_size.gif')
-        if os.name == 'posix':
-            os.system('say choose your grid size.&')
+        self.keyboard_bindings()
+        self.backdrop.show(self.screen, 'grid_size')
+        self.audio.say('choose your grid size.')
 
     def start_game(self, width, height):
-        """Starts the game with grid size choice and control setting."""
-        gameObj = game.Game(width, height, self.relative_controls)
-        gameObj.start_game()
+        """Plays a match with grid size choice and control setting, then shows the
+        results screen. The match's turtles and keys come from the session."""
+        self.pen.hideturtle()
+        self.audio.stop()
+        self.game = game.Game(width, height, self.relative_controls, pool=self.pool,
+                              keys=self.keys, **self.game_options)
+        self.game.play()
+        self.game.display_winner()
+        self.current_screen = 'results'
+        self.results_until = time.perf_counter() + self.RESULTS_TIME
+        # The match bound its own keys; put the menu's back
+        self.keyboard_bindings()
+        self.keys.listen(self.MENU_KEYS)
+
+    def render(self, alpha):
+        turtle.update()
+        if self.startup_stats:
+            self.startup_stats = False
+            print('imports {:.1f} ms, first menu frame {:.1f} ms after start'.format(
+                (IMPORTED - STARTED) * 1000, (time.perf_counter() - STARTED) * 1000))
 
     def start_menu(self):
-        """Main menu loop. Creates cursor, displays main menu, and plays bgm."""
+        """Session loop. Creates the screen and cursor, plays bgm, and runs scenes
+        until quit."""
         self.create_screen()
         self.pen = turtle.Turtle()
         self.pen.shapesize(stretch_wid=3, stretch_len=3, outline=None)
         self.pen.cursor_pos = 3
         self.pen.pencolor('#40BBE3')
         self.pen.penup()
-        # Stop music when returning from game and restart main menu music
-        if os.name == 'posix':
-            os.system('killall afplay')
-            os.system('afplay sounds/main_menu.m4a&')
-        # Change cursor position based on keybindings
-        while True:
-            turtle.update()
-            self.set_cursor_master()
-            self.keyboard_bindings()
+        self.audio.play('sounds/main_menu.m4a')
+        # Bind every menu key once; screens only swap the action table
+        self.keyboard_bindings()
+        self.keys.listen(self.MENU_KEYS)
+        while self.current_screen != 'quit':
+            if self.current_screen == 'match':
+                self.start_game(*self.grid)
+            else:
+                # Change cursor position based on keybindings, sleeping between frames,
+                # until a key press leaves the menu screens
+                clock = FrameClock(self.MENU_FPS, self.MENU_FPS)
+                clock.run(self.set_cursor_master, self.render,
+                          lambda: self.current_screen in self.MENU_SCREENS)
+        self.audio.close()
+        turtle.bye()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='TurtleTron')
+    parser.add_argument('--record', metavar='FILE',
+                        help='stream a replay of each match to FILE (overwritten per match)')
+    parser.add_argument('--replay', metavar='FILE', help='play back a recorded match')
+    parser.add_argument('--fast', action='store_true',
+                        help='with --replay, fast-forward headless to the end and print the result')
+    parser.add_argument('--render-stats', action='store_true',
+                        help='print how long turtle.update() takes every few seconds')
+    parser.add_argument('--hud-stats', action='store_true',
+                        help='show tick rate, frame time, and trail lengths on screen')
+    parser.add_argument('--bots', type=int, default=0, choices=[0, 1, 2],
+                        help='computer players to add as P3 and P4')
+    parser.add_argument('--profile', action='store_true',
+                        help='time each phase of the game loop and print p50/p99/max after each match')
+    parser.add_argument('--profile-overlay', action='store_true',
+                        help='like --profile, and show the timings on screen')
+    parser.add_argument('--arena', choices=sorted(GRID_SIZES),
+                        help='play every match on this grid size, e.g. huge (10,000 x 10,000 '
+                             'cells seen through a scrolling camera)')
+    parser.add_argument('--trail-length', type=int, default=None,
+                        help='snake mode: trails lose their oldest cells past this length')
+    parser.add_argument('--startup-stats', action='store_true',
+                        help='print import time and time to the first menu frame')
+    args = parser.parse_args()
+    if args.trail_length is not None and args.trail_length < Cycle.MAX_SPEED:
+        # A move can't be longer than the trail it's added to
+        parser.error('--trail-length must be at least the top speed ({})'.format(
+            Cycle.MAX_SPEED))
+    return args
 
 if __name__ == '__main__':
     if sys.version_info[0] < 3:
         raise SystemExit('Python 3 required!')
-    menu = MainMenu()
-    menu.start_menu()
+    args = parse_args()
+    if args.replay and args.fast:
+        simulation = replay.fast_forward(args.replay)
+        winner = simulation.winner()
+        print('Ticks: {}'.format(simulation.ticks))
+        for cycle in simulation.cycles:
+            print('{}: {} lives'.format(cycle.name, cycle.lives))
+        print('Winner: {}'.format(winner.name if winner else 'none'))
+    else:
+        game_options = {
+            'render_stats': args.render_stats,
+            'hud_stats': args.hud_stats,
+            'profile': args.profile,
+            'profile_overlay': args.profile_overlay,
+        }
+        if args.replay:
+            game.Game(replay=args.replay, **game_options).start_game()
+        else:
+            menu = MainMenu(startup_stats=args.startup_stats, arena=args.arena,
+                            record=args.record, bots=args.bots,
+                            trail_length=args.trail_length, **game_options)
+            menu.start_menu()
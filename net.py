@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import queue
+import random
+import struct
+import asyncio
+import threading
+from arena import segment_cells
+from simulation import Simulation, GRID_SIZES
+from controllers import CONTROLLERS, BotController
+from clock import TICK_RATE
+
+PORT = 7011
+MAX_CLIENTS = 4
+MAGIC = b'TRNN'
+VERSION = 2
+# Server to client, once: magic, version, seed, width, height, players, your player
+# number, trail length (0 for no limit)
+HELLO = struct.Struct('<4sHIHHBBI')
+# Server to client, every tick: tick, flags, number of crashes, winner (0 for none).
+# Followed by one HEAD per player and one CRASH per crash, so a frame is the same
+# size however long the trails get.
+FRAME = struct.Struct('<IBBB')
+# Head cell and heading (in quarter turns) of one light cycle after the tick
+HEAD = struct.Struct('<hhB')
+# Player number, cause, lives left, and the cell it crashed into
+CRASH = struct.Struct('<BBbhh')
+# Client to server: one byte per input command, nothing else
+
+# Frame flags
+RESET = 1 # Someone crashed and the grid was reset; heads are the respawn points
+GAME_OVER = 2
+
+CAUSES = [Simulation.WALL, Simulation.SELF, Simulation.ENEMY, Simulation.HEAD_ON]
+
+
+def encode_frame(simulation, crashes):
+    """Packs the tick just played: every head, plus the crashes and lives lost."""
+    flags = 0
+    winner = 0
+    if crashes:
+        flags |= RESET
+    if simulation.is_game_over():
+        flags |= GAME_OVER
+        if simulation.winner():
+            winner = simulation.winner().number
+    parts = [FRAME.pack(simulation.ticks, flags, len(crashes), winner)]
+    for cycle in simulation.cycles:
+        parts.append(HEAD.pack(cycle.coord[0], cycle.coord[1], cycle.heading // 90))
+    for cycle, coord in crashes:
+        parts.append(CRASH.pack(cycle.number, CAUSES.index(cycle.crash_cause),
+                                cycle.lives, coord[0], coord[1]))
+    return b''.join(parts)
+
+
+async def read_frame(reader, players):
+    """Reads one frame as (tick, flags, winner, heads, crashes). Heads are (x, y,
+    heading) and crashes (number, cause, lives, coord)."""
+    tick, flags, count, winner = FRAME.unpack(await reader.readexactly(FRAME.size))
+    data = await reader.readexactly(HEAD.size * players + CRASH.size * count)
+    heads = []
+    for i in range(players):
+        x, y, quarter = HEAD.unpack_from(data, i * HEAD.size)
+        heads.append((x, y, quarter * 90))
+    crashes = []
+    for i in range(count):
+        number, cause, lives, x, y = CRASH.unpack_from(data, HEAD.size * players + i * CRASH.size)
+        crashes.append((number, CAUSES[cause], lives, (x, y)))
+    return (tick, flags, winner, heads, crashes)
+
+
+def apply_frame(simulation, frame):
+    """Mirrors a server frame into a local simulation: new cells are filled in from
+    each cycle's last head, and lives and resets are copied. Returns crashes as
+    (cycle, coord), like Simulation.step."""
+    tick, flags, winner, heads, crashes = frame
+    simulation.ticks = tick
+    result = []
+    for number, cause, lives, coord in crashes:
+        cycle = simulation.cycles[number - 1]
+        cycle.lives = lives
+        cycle.crash_cause = cause
+        cycle.status = cycle.CRASHED
+        result.append((cycle, coord))
+    if flags & RESET:
+        simulation.arena.clear()
+        for cycle, (x, y, heading) in zip(simulation.cycles, heads):
+            cycle.respawn(x, y, heading)
+        return result
+    for cycle, (x, y, heading) in zip(simulation.cycles, heads):
+        start = cycle.positions.head or cycle.coord # Swept from the spawn, as on the server
+        cycle.heading = heading
+        cycle.x, cycle.y, cycle.coord = x, y, (x, y)
+        simulation.claim(cycle, list(segment_cells(start, cycle.coord)))
+    return result
+
+
+class MatchServer(object):
+    """Authoritative match host. Waits for its clients, then runs the simulation at
+    the tick rate, applying each client's commands to its own light cycle. Any
+    players past the clients are bots run on the server. Frames are packed once per
+    tick and sent to every client in batches of send_every ticks."""
+
+    def __init__(self, host='127.0.0.1', port=PORT, clients=2, bots=0, grid='medium',
+                 seed=None, tick_rate=TICK_RATE, send_every=2, trail_length=None):
+        if clients + bots > MAX_CLIENTS:
+            raise ValueError("No more than 4 players allowed.")
+        if clients < 1:
+            # The match only starts once every client has joined
+            raise ValueError("At least 1 client is needed.")
+        self.host = host
+        self.port = port
+        self.clients = clients
+        self.tick_rate = tick_rate
+        self.send_every = send_every
+        width, height = GRID_SIZES[grid]
+        self.simulation = Simulation(width, height, seed, trail_length=trail_length)
+        self.simulation.create_cycles(clients + bots)
+        self.bots = []
+        for cycle in self.simulation.cycles[clients:]:
+            rng = random.Random(self.simulation.seed + cycle.number)
+            self.bots.append(BotController(self.simulation, cycle, rng))
+        self.writers = {} # Player number -> stream writer, while connected
+        self.joined = 0
+        self.full = None
+        self.listening = None
+
+    async def serve(self):
+        """Plays one match and returns the simulation once it's over or every client
+        has left."""
+        self.full = asyncio.Event()
+        server = await asyncio.start_server(self.accept, self.host, self.port)
+        # Port 0 picks a free port; publish the real one
+        self.port = server.sockets[0].getsockname()[1]
+        if self.listening:
+            self.listening.set()
+        async with server:
+            await self.full.wait()
+            await self.play()
+        for writer in self.writers.values():
+            writer.close()
+        return self.simulation
+
+    async def accept(self, reader, writer):
+        if self.full.is_set():
+            writer.close()
+            return
+        self.joined += 1
+        number = self.joined
+        self.writers[number] = writer
+        simulation = self.simulation
+        writer.write(HELLO.pack(MAGIC, VERSION, simulation.seed, simulation.width,
+                                simulation.height, len(simulation.cycles), number,
+                                simulation.trail_length or 0))
+        if self.joined == self.clients:
+            self.full.set()
+        try:
+            while True:
+                data = await reader.read(64)
+                if not data:
+                    break
+                for command in data:
+                    simulation.push_input(number, command)
+        except (ConnectionError, asyncio.CancelledError):
+            pass # Client left, or the match is over and the server is shutting down
+        self.writers.pop(number, None)
+
+    async def play(self):
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.tick_rate
+        next_tick = loop.time()
+        pending = []
+        simulation = self.simulation
+        while self.writers:
+            for bot in self.bots:
+                command = bot.decide()
+                if command is not None:
+                    simulation.push_input(bot.cycle.number, command)
+            crashes = simulation.step()
+            pending.append(encode_frame(simulation, crashes))
+            over = simulation.is_game_over()
+            if len(pending) >= self.send_every or over:
+                await self.broadcast(b''.join(pending))
+                pending = []
+            if over:
+                break
+            next_tick += interval
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+    async def broadcast(self, data):
+        writers = list(self.writers.values())
+        for writer in writers:
+            writer.write(data)
+        try:
+            await asyncio.gather(*[writer.drain() for writer in writers])
+        except ConnectionError:
+            pass
+
+
+class MatchClient(object):
+    """Connection to a MatchServer for the turtle front end. The socket runs on an
+    asyncio loop in a background thread so the game loop can stay synchronous:
+    frames come out of a queue and commands go in through send()."""
+
+    def __init__(self, host='127.0.0.1', port=PORT):
+        self.host = host
+        self.port = port
+        self.frames = queue.Queue()
+        self.connected = threading.Event()
+        self.closed = False
+        self.error = None
+        self.loop = None
+        self.writer = None
+
+    def connect(self, timeout=10):
+        """Blocks until the server's hello arrives, filling in seed, width, height,
+        players, number (the local player's number), and trail_length."""
+        thread = threading.Thread(target=self.run_loop, daemon=True)
+        thread.start()
+        if not self.connected.wait(timeout) or self.error:
+            raise ConnectionError('Could not join {}:{}: {}'.format(self.host, self.port,
+                                                                    self.error))
+
+    def run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.receive())
+        except (OSError, asyncio.IncompleteReadError, ValueError) as error:
+            self.error = error
+        finally:
+            self.closed = True
+            self.connected.set()
+
+    async def receive(self):
+        reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        magic, version, self.seed, self.width, self.height, self.players, \
+            self.number, self.trail_length = HELLO.unpack(await reader.readexactly(HELLO.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a TurtleTron server')
+        self.connected.set()
+        while True:
+            frame = await read_frame(reader, self.players)
+            self.frames.put(frame)
+            if frame[1] & GAME_OVER:
+                break
+        self.writer.close()
+
+    def send(self, command):
+        """Queues a command for the local player on the server."""
+        if not self.closed:
+            self.loop.call_soon_threadsafe(self.writer.write, bytes((command,)))
+
+    def next_frame(self):
+        """The oldest frame not yet applied, or None."""
+        try:
+            return self.frames.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        if not self.closed and self.loop:
+            self.loop.call_soon_threadsafe(self.writer.close)
+
+
+async def stand_in(host, port, controller='avoid', seed=0):
+    """Headless client for testing: mirrors the match from the server's frames and
+    drives its light cycle with a computer controller. Returns the mirror simulation
+    and the number of bytes received."""
+    reader, writer = await asyncio.open_connection(host, port)
+    magic, version, match_seed, width, height, players, number, trail_length = \
+        HELLO.unpack(await reader.readexactly(HELLO.size))
+    simulation = Simulation(width, height, match_seed, trail_length=trail_length)
+    simulation.create_cycles(players)
+    cycle = simulation.cycles[number - 1]
+    brain = CONTROLLERS[controller](simulation, cycle, random.Random(seed + number))
+    received = HELLO.size
+    try:
+        while True:
+            frame = await read_frame(reader, players)
+            received += FRAME.size + HEAD.size * players + CRASH.size * len(frame[4])
+            apply_frame(simulation, frame)
+            if frame[1] & GAME_OVER:
+                break
+            command = brain.decide()
+            if command is not None:
+                writer.write(bytes((command,)))
+    except asyncio.IncompleteReadError:
+        pass
+    writer.close()
+    return simulation, received
+
+
+async def local_match(clients, bots, grid, seed, controller, tick_rate, send_every,
+                      trail_length=None):
+    """A server and its stand-in clients on one loop. Returns the server's result and
+    what each stand-in saw."""
+    server = MatchServer('127.0.0.1', 0, clients, bots, grid, seed, tick_rate, send_every,
+                         trail_length)
+    server.listening = asyncio.Event()
+    serving = asyncio.ensure_future(server.serve())
+    await server.listening.wait()
+    # Seeded from the match, which picks a random seed if it wasn't given one
+    stand_ins = [stand_in('127.0.0.1', server.port, controller, server.simulation.seed)
+                 for i in range(clients)]
+    mirrors = await asyncio.gather(*stand_ins)
+    simulation = await serving
+    return simulation, mirrors
+
+
+def add_arguments(parser):
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to serve on or connect to; serve on 0.0.0.0 '
+                             'to take players from other machines')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--tick-rate', type=int, default=TICK_RATE)
+    parser.add_argument('--clients', type=int, default=2,
+                        help='network players the server waits for')
+    parser.add_argument('--server-bots', type=int, default=0,
+                        help='extra light cycles the server drives itself')
+    parser.add_argument('--send-every', type=int, default=2,
+                        help='ticks batched into each send')
+    parser.add_argument('--stand-ins', action='store_true',
+                        help='with --serve, play the clients with local bots and print '
+                             'the result as JSON')
+
+
+def main(args):
+    seed = args.seed
+    if args.stand_ins:
+        simulation, mirrors = asyncio.run(local_match(
+            args.clients, args.server_bots, args.grid, seed, args.controller, args.tick_rate,
+            args.send_every, args.trail_length))
+        winner = simulation.winner()
+        result = {
+            'seed': simulation.seed,
+            'winner': winner.name if winner else None,
+            'lives': dict((cycle.name, cycle.lives) for cycle in simulation.cycles),
+            'ticks': simulation.ticks,
+            # Every stand-in's mirror should match the server exactly
+            'in_sync': all([cycle.coord for cycle in mirror.cycles] ==
+                           [cycle.coord for cycle in simulation.cycles] and
+                           [cycle.lives for cycle in mirror.cycles] ==
+                           [cycle.lives for cycle in simulation.cycles]
+                           for mirror, received in mirrors),
+            'bytes_per_tick': [round(received / max(simulation.ticks, 1), 1)
+                               for mirror, received in mirrors],
+        }
+        sys.stdout.write(json.dumps(result) + '\n')
+    else:
+        server = MatchServer(args.host, args.port, args.clients, args.server_bots, args.grid,
+                             seed, args.tick_rate, args.send_every, args.trail_length)
+        print('Waiting for {} player(s) on port {}'.format(args.clients, args.port))
+        asyncio.run(server.serve())
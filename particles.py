@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import math
+from array import array
+
+
+class ParticleSystem(object):
+    """Crash particles kept in parallel arrays (position, velocity, remaining life)
+    and advanced together in one step. Holds no drawing state, so any renderer
+    can read it."""
+
+    SPEED = 10 # Distance per tick
+    LIFE = 10 # Ticks a particle lasts
+
+    def __init__(self, capacity=80):
+        self.capacity = capacity
+        self.x = array('d', bytes(8 * capacity))
+        self.y = array('d', bytes(8 * capacity))
+        self.dx = array('d', bytes(8 * capacity))
+        self.dy = array('d', bytes(8 * capacity))
+        self.life = array('i', bytes(array('i').itemsize * capacity))
+        self.colors = ['white'] * capacity
+        self.next_slot = 0
+
+    def explode(self, x, y, color, headings):
+        """Launches one particle per heading (degrees) from x, y. When the pool is
+        full the oldest particles are reused."""
+        for heading in headings:
+            i = self.next_slot
+            self.next_slot = (i + 1) % self.capacity
+            radians = math.radians(heading)
+            self.x[i] = x
+            self.y[i] = y
+            self.dx[i] = math.cos(radians) * self.SPEED
+            self.dy[i] = math.sin(radians) * self.SPEED
+            self.life[i] = self.LIFE
+            self.colors[i] = color
+
+    def step(self):
+        """Moves every live particle and ages it by one tick."""
+        x, y, dx, dy, life = self.x, self.y, self.dx, self.dy, self.life
+        for i in range(self.capacity):
+            if life[i] > 0:
+                x[i] += dx[i]
+                y[i] += dy[i]
+                life[i] -= 1
+
+    def clear(self):
+        for i in range(self.capacity):
+            self.life[i] = 0
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+from array import array
+
+
+class PhaseTimes(object):
+    """Ring buffer of the most recent durations for one phase, plus the all-time max."""
+
+    def __init__(self, size):
+        self.samples = array('d', bytes(8 * size))
+        self.size = size
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.samples[self.count % self.size] = seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Percentile over the samples still in the buffer, in seconds."""
+        kept = sorted(self.samples[:min(self.count, self.size)])
+        if not kept:
+            return 0.0
+        return kept[min(int(len(kept) * fraction), len(kept) - 1)]
+
+
+class Profiler(object):
+    """Times each phase of a tick or frame. Call start() at the top of the loop and
+    lap(phase) after each phase; a lap records the time since the previous one."""
+
+    def __init__(self, size=4096, timer=time.perf_counter):
+        self.size = size
+        self.timer = timer
+        self.phases = {} # Phase name -> PhaseTimes, in first-seen order
+        self.last = timer()
+
+    def __bool__(self):
+        return True
+
+    def start(self):
+        self.last = self.timer()
+
+    def lap(self, phase):
+        now = self.timer()
+        times = self.phases.get(phase)
+        if times is None:
+            times = self.phases[phase] = PhaseTimes(self.size)
+        times.add(now - self.last)
+        self.last = now
+
+    def report(self):
+        """(phase, samples, p50, p99, max) for every phase, times in ms."""
+        rows = []
+        for phase, times in self.phases.items():
+            rows.append((phase, times.count, times.percentile(0.5) * 1000,
+                         times.percentile(0.99) * 1000, times.max * 1000))
+        return rows
+
+    def dump(self, stream=sys.stderr):
+        stream.write('{:<16} {:>8} {:>9} {:>9} {:>9}\n'.format(
+            'phase', 'samples', 'p50 ms', 'p99 ms', 'max ms'))
+        for row in self.report():
+            stream.write('{:<16} {:>8} {:>9.3f} {:>9.3f} {:>9.3f}\n'.format(*row))
+
+
+class NullProfiler(object):
+    """Stands in when profiling is off, so timed code needs no checks."""
+
+    def __bool__(self):
+        return False
+
+    def start(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import math
+import re
+import zlib
+import struct
+import multiprocessing
+from array import array
+from collections import deque
+from clock import TICK_RATE
+from simulation import PLAYER_COLORS
+from replay import ReplayReader
+
+# Palette indexes. Player n is drawn in index PLAYERS + n - 1.
+BACKGROUND, BORDER, PLAYERS = 0, 1, 2
+# Black background and turtle's 'blue' border, as on screen
+PALETTE = ['#000000', '#0000ff'] + PLAYER_COLORS
+# Longest side of a frame. Bigger arenas are shrunk to fit, several cells a pixel.
+MAX_SIDE = 1024
+# Runs of one byte value, the unit the GIF encoder works through
+RUNS = re.compile(rb'(.)\1*', re.DOTALL)
+
+
+def palette_bytes(colors, size):
+    """The colours as packed RGB triples, padded with black to size entries."""
+    data = bytearray()
+    for color in colors:
+        data += bytes.fromhex(color.lstrip('#'))
+    return bytes(data) + bytes(3 * (size - len(colors)))
+
+
+class Rasterizer(object):
+    """Draws a headless match into a preallocated bytearray of palette indexes, one
+    byte a pixel, laid out like the game window (border 50 pixels in from the edge).
+    draw() after every tick only paints the cells added to each trail since the last
+    call, and notes which pixels they were so a writer can skip the rest of the
+    frame. A new round wipes the frame back to the border in one bulk copy.
+
+    Cells that fall off a bounded trail are erased the same way: the pixels each
+    trail painted are queued, oldest first, and a count per pixel (several cells
+    share one when the frame is shrunk) says when one is empty again."""
+
+    def __init__(self, simulation, shrink=None):
+        self.simulation = simulation
+        if shrink is None:
+            shrink = max(1, math.ceil(max(simulation.width, simulation.height) / MAX_SIDE))
+        self.shrink = shrink # Cells along each side of a pixel
+        self.half_width = int(simulation.width) // 2
+        self.half_height = int(simulation.height) // 2
+        self.width = -(-int(simulation.width) // shrink)
+        self.height = -(-int(simulation.height) // shrink)
+        self.pixels = bytearray(self.width * self.height)
+        self.draw_border()
+        self.blank = bytes(self.pixels)
+        self.drawn = [] # Cells added to each light cycle's trail already drawn
+        self.changed = None # Offsets painted since take_changes(), None for all of them
+        self.counts = None
+        if simulation.trail_length:
+            self.counts = array('H', bytes(2 * len(self.pixels))) # Cells on each pixel
+            self.no_counts = array('H', self.counts)
+        self.shown = [] # Offsets painted for each bounded trail, oldest first
+        self.clear()
+
+    def pixel(self, x, y):
+        """Offset of the pixel covering cell (x, y)."""
+        return ((self.half_height - y) // self.shrink) * self.width + \
+            (x + self.half_width) // self.shrink
+
+    def draw_border(self):
+        x_boundary = int(self.simulation.x_boundary)
+        y_boundary = int(self.simulation.y_boundary)
+        for x in range(-x_boundary, x_boundary + 1):
+            self.pixels[self.pixel(x, y_boundary)] = BORDER
+            self.pixels[self.pixel(x, -y_boundary)] = BORDER
+        for y in range(-y_boundary, y_boundary + 1):
+            self.pixels[self.pixel(x_boundary, y)] = BORDER
+            self.pixels[self.pixel(-x_boundary, y)] = BORDER
+
+    def clear(self):
+        """Back to an empty arena. The whole frame has changed."""
+        self.pixels[:] = self.blank
+        self.drawn = [0] * len(self.simulation.cycles)
+        self.changed = None
+        if self.counts is not None:
+            self.counts[:] = self.no_counts
+            self.shown = [deque() for cycle in self.simulation.cycles]
+
+    def draw(self):
+        """Paints whatever the light cycles added since the last call. Call it after
+        every tick; a trail with fewer cells added than have been drawn means a new
+        round."""
+        cycles = self.simulation.cycles
+        if len(self.drawn) != len(cycles) or \
+        any(cycle.positions.added < drawn for cycle, drawn in zip(cycles, self.drawn)):
+            self.clear()
+        pixels = self.pixels
+        # Nobody needs the offsets if the whole frame is due anyway
+        changed = self.changed if self.changed is not None else []
+        if self.counts is not None:
+            # Before painting, so a cell another trail just took keeps its colour
+            self.erase(changed)
+        for i, cycle in enumerate(cycles):
+            added = cycle.positions.added - self.drawn[i]
+            if not added:
+                continue
+            self.drawn[i] += added
+            color = PLAYERS + cycle.number - 1
+            # Cells that came and went since the last call are never painted
+            offsets = self.offsets(cycle.positions.last(added))
+            for offset in offsets:
+                pixels[offset] = color
+            changed.extend(offsets)
+            if self.counts is not None:
+                counts = self.counts
+                for offset in offsets:
+                    counts[offset] += 1
+                self.shown[i].extend(offsets)
+
+    def offsets(self, keys):
+        """Pixel offsets of packed trail cells."""
+        width, shrink = self.width, self.shrink
+        half_width, half_height = self.half_width, self.half_height
+        return [((half_height - ((key & 0xFFFF) - 0x8000)) // shrink) * width +
+                ((key >> 16) + half_width) // shrink for key in keys]
+
+    def erase(self, changed):
+        """Takes the cells bounded trails have lost since the last call off the frame."""
+        pixels, blank, counts = self.pixels, self.blank, self.counts
+        for i, cycle in enumerate(self.simulation.cycles):
+            shown = self.shown[i]
+            # Everything painted or still to paint, less what the trail holds now
+            gone = len(shown) + cycle.positions.added - self.drawn[i] - len(cycle.positions)
+            for each in range(min(gone, len(shown))):
+                offset = shown.popleft()
+                counts[offset] -= 1
+                if not counts[offset]:
+                    pixels[offset] = blank[offset]
+                    changed.append(offset)
+
+    def take_changes(self):
+        """Offsets of the pixels painted since the last call, or None if the whole
+        frame was redrawn, then starts over."""
+        changed, self.changed = self.changed, []
+        return changed
+
+
+def runs_of(data):
+    """(byte, count) for each run of one byte value in data."""
+    for run in RUNS.finditer(data):
+        yield data[run.start()], run.end() - run.start()
+
+
+def lzw_compress(runs, min_code_size):
+    """GIF flavoured LZW: variable width codes up to 12 bits, packed LSB first.
+    Starts with a clear code and starts over with another once the table is full.
+    Takes the pixels as (byte, count) runs, neighbours never the same byte. Frames
+    are mostly long runs of one colour, so a run is matched a table entry at a time
+    rather than a byte at a time: the codes for 1, 2, 3... repeats of each byte are
+    kept in a list, and the longest one that fits is an index away."""
+    clear = 1 << min_code_size
+    end = clear + 1
+    output = bytearray()
+    buffer = bits = 0
+    code_size = min_code_size + 1
+    next_code = end + 1
+    table = {} # (prefix code << 8) | byte -> code
+    repeats = [] # repeats[byte][n - 1] is the code for n of byte in a row
+
+    def write(code):
+        nonlocal buffer, bits
+        buffer |= code << bits
+        bits += code_size
+        while bits >= 8:
+            output.append(buffer & 0xFF)
+            buffer >>= 8
+            bits -= 8
+
+    def start():
+        nonlocal code_size, next_code, table, repeats
+        write(clear)
+        code_size = min_code_size + 1
+        next_code = end + 1
+        table = {}
+        repeats = [[byte] for byte in range(clear)]
+
+    def emit(prefix, key):
+        """Writes prefix and adds key, prefix plus the byte after it, to the table.
+        Returns the new code, or None if the table filled up and was cleared."""
+        nonlocal next_code, code_size
+        write(prefix)
+        code = next_code
+        table[key] = code
+        next_code += 1
+        if next_code > (1 << code_size) and code_size < 12:
+            code_size += 1
+        if next_code == 4096:
+            start()
+            return None
+        return code
+
+    start()
+    prefix = None
+    for byte, left in runs:
+        # How many of byte the prefix is, or 0 if it's anything else
+        length = 0
+        if prefix is None:
+            prefix, length, left = byte, 1, left - 1
+        while left:
+            if length:
+                chain = repeats[byte]
+                take = min(len(chain) - length, left)
+                length += take
+                left -= take
+                prefix = chain[length - 1]
+                if left:
+                    code = emit(prefix, (prefix << 8) | byte)
+                    if code is not None:
+                        chain.append(code)
+                    prefix, length, left = byte, 1, left - 1
+            else:
+                key = (prefix << 8) | byte
+                left -= 1
+                code = table.get(key)
+                if code is None:
+                    emit(prefix, key)
+                    prefix, length = byte, 1
+                else:
+                    prefix = code
+    write(prefix)
+    # No entry follows the last code, so the decoder's table has caught up by end
+    if next_code == (1 << code_size) and code_size < 12:
+        code_size += 1
+    write(end)
+    if bits:
+        output.append(buffer & 0xFF)
+    return bytes(output)
+
+
+class GifWriter(object):
+    """Streams an animated GIF to disk a frame at a time, so nothing but the
+    current frame is ever held in memory. Each frame only covers the box around the
+    pixels that changed since the one before, and everything else in the box is
+    transparent, which leaves long runs for the encoder."""
+
+    def __init__(self, path, width, height, palette, delay):
+        self.file = open(path, 'wb')
+        self.delay = delay # Hundredths of a second per frame
+        self.frames = 0
+        self.transparent = len(palette) # Spare palette entry
+        size = 1
+        while (1 << size) <= self.transparent:
+            size += 1
+        self.min_code_size = max(2, size)
+        # Screen descriptor with a global colour table, then loop forever
+        self.file.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0xF0 | (size - 1), 0, 0))
+        self.file.write(palette_bytes(palette, 1 << size))
+        self.file.write(b'\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+    def frame(self, raster, changed):
+        """Writes the changed pixel offsets from raster.take_changes(). None writes
+        the whole frame; no changes write one pixel as it already is, so the frame
+        still takes its time."""
+        if changed is None:
+            left, top, width, height = 0, 0, raster.width, raster.height
+            runs = runs_of(raster.pixels)
+        else:
+            changed = sorted(set(changed)) or [0]
+            columns = [offset % raster.width for offset in changed]
+            rows = [offset // raster.width for offset in changed]
+            left, top = min(columns), rows[0]
+            width, height = max(columns) - left + 1, rows[-1] - top + 1
+            runs = self.changed_runs(raster.pixels, changed, columns, rows, left, top, width,
+                                     height)
+        # Graphic control: keep this frame under the next one, and see through it
+        # where nothing changed
+        self.file.write(struct.pack('<BBBBHBB', 0x21, 0xF9, 4, 0x05, self.delay,
+                                    self.transparent, 0))
+        self.file.write(struct.pack('<BHHHHB', 0x2C, left, top, width, height, 0))
+        data = lzw_compress(runs, self.min_code_size)
+        self.file.write(bytes((self.min_code_size,)))
+        for start in range(0, len(data), 255):
+            block = data[start:start + 255]
+            self.file.write(bytes((len(block),)) + block)
+        self.file.write(b'\x00')
+        self.frames += 1
+
+    def changed_runs(self, pixels, changed, columns, rows, left, top, width, height):
+        """The box as runs: the changed pixels in their colours, transparent in
+        between."""
+        runs = []
+        at = 0 # Position in the box the runs so far reach
+        for offset, column, row in zip(changed, columns, rows):
+            position = (row - top) * width + column - left
+            color = pixels[offset]
+            if position > at:
+                runs.append((self.transparent, position - at))
+            elif runs and runs[-1][0] == color:
+                runs[-1] = (color, runs[-1][1] + 1)
+                at = position + 1
+                continue
+            runs.append((color, 1))
+            at = position + 1
+        if at < width * height:
+            runs.append((self.transparent, width * height - at))
+        return runs
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write(b'\x3B')
+            self.file.close()
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + \
+        struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+class PngSequence(object):
+    """Writes each frame to its own indexed PNG, frame000001.png onwards, in a
+    directory of its own."""
+
+    def __init__(self, directory, width, height, palette):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.frames = 0
+        self.header = b'\x89PNG\r\n\x1a\n' + \
+            png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)) + \
+            png_chunk(b'PLTE', palette_bytes(palette, len(palette)))
+        self.width = width
+        self.height = height
+
+    def frame(self, raster, changed):
+        """Writes the whole frame; a PNG can't be patched like a GIF frame can."""
+        self.frames += 1
+        rows = bytearray()
+        pixels, width = raster.pixels, self.width
+        for row in range(self.height):
+            rows.append(0) # No filter
+            rows += pixels[row * width:(row + 1) * width]
+        path = os.path.join(self.directory, 'frame{:06d}.png'.format(self.frames))
+        with open(path, 'wb') as image:
+            image.write(self.header + png_chunk(b'IDAT', zlib.compress(bytes(rows))) +
+                        png_chunk(b'IEND', b''))
+
+    def close(self):
+        pass
+
+
+def render_replay(path, output, format='gif', every=4, shrink=None):
+    """Plays a recording headless and renders a frame every so many ticks to output,
+    an animated GIF or a directory of PNGs. Returns a summary as a dict."""
+    reader = ReplayReader(path)
+    simulation = reader.create_simulation()
+    raster = Rasterizer(simulation, shrink)
+    if format == 'gif':
+        writer = GifWriter(output, raster.width, raster.height, PALETTE,
+                           max(1, round(every * 100 / TICK_RATE)))
+    else:
+        writer = PngSequence(output, raster.width, raster.height, PALETTE)
+    try:
+        writer.frame(raster, raster.take_changes())
+        while not simulation.is_game_over() and not reader.is_finished(simulation.ticks):
+            simulation.step(reader.commands_for(simulation.ticks + 1))
+            raster.draw()
+            if simulation.ticks % every == 0:
+                writer.frame(raster, raster.take_changes())
+        if simulation.ticks % every:
+            writer.frame(raster, raster.take_changes())
+    finally:
+        writer.close()
+        reader.close()
+    return {'replay': path, 'output': output, 'ticks': simulation.ticks,
+            'frames': writer.frames, 'size': [raster.width, raster.height]}
+
+
+def render_replay_args(args):
+    return render_replay(*args)
+
+
+def output_path(path, format):
+    base = os.path.splitext(path)[0]
+    return base + '.gif' if format == 'gif' else base + '_frames'
+
+
+def render_batch(paths, workers=None, format='gif', every=4, shrink=None, output=sys.stdout):
+    """Renders recordings across a process pool, each next to its replay file, and
+    writes one JSON line per finished render to output."""
+    jobs = [(path, output_path(path, format), format, every, shrink) for path in paths]
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap_unordered(render_replay_args, jobs):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+
+def add_arguments(parser):
+    parser.add_argument('--render', nargs='+', metavar='REPLAY',
+                        help='render recorded matches to animated GIFs without a display')
+    parser.add_argument('--format', choices=['gif', 'png'], default='gif',
+                        help='one animated GIF, or a directory of PNG frames, per match')
+    parser.add_argument('--frame-every', type=int, default=4,
+                        help='ticks between rendered frames')
+    parser.add_argument('--shrink', type=int, default=None,
+                        help='cells along each side of a pixel (default: fit {} pixels)'.format(MAX_SIDE))
+
+
+def main(args):
+    render_batch(args.render, args.workers, args.format, args.frame_every, args.shrink)
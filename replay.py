@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import struct
+from simulation import Simulation
+
+MAGIC = b'TRON'
+# Spawn placement changed in 2 and the trail length was added in 3, so older
+# recordings can't be replayed
+VERSION = 3
+# magic, version, seed, width, height, players, inputs per tick, trail length (0 for
+# no limit)
+HEADER = struct.Struct('<4sHIHHBBI')
+# tick, player number, command. Player 0 marks the end of the recording.
+RECORD = struct.Struct('<IBB')
+END = 0
+
+
+class ReplayWriter(object):
+    """Streams a match to disk: a header with everything needed to rebuild the
+    simulation (the seed covers spawns, respawn headings, and particle headings),
+    then one fixed-size record per applied input command. Nothing is kept in memory."""
+
+    def __init__(self, path, simulation, players):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, simulation.seed, simulation.width,
+                                    simulation.height, players, simulation.inputs.per_tick,
+                                    simulation.trail_length or 0))
+        self.ticks = 0
+
+    def record(self, tick, commands):
+        """Writes the commands applied on tick as (number, command) tuples."""
+        self.ticks = tick
+        for number, command in commands:
+            self.file.write(RECORD.pack(tick, number, command))
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write(RECORD.pack(self.ticks, END, 0))
+            self.file.close()
+
+
+class ReplayReader(object):
+    """Reads a recording back one record at a time."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        magic, version, self.seed, self.width, self.height, self.players, \
+            self.inputs_per_tick, self.trail_length = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a TurtleTron replay.'.format(path))
+        self.next_record = self.read_record()
+        self.end_tick = None # Known once the end record is reached
+
+    def read_record(self):
+        data = self.file.read(RECORD.size)
+        if len(data) < RECORD.size:
+            return None
+        return RECORD.unpack(data)
+
+    def create_simulation(self):
+        """Builds a simulation in the same starting state as the recorded one."""
+        simulation = Simulation(self.width, self.height, self.seed, self.inputs_per_tick,
+                                trail_length=self.trail_length)
+        simulation.create_cycles(self.players)
+        return simulation
+
+    def commands_for(self, tick):
+        """Returns the commands recorded for tick as (number, command) tuples.
+        Ticks must be asked for in order."""
+        commands = []
+        while self.next_record and self.next_record[0] <= tick:
+            record_tick, number, command = self.next_record
+            if number == END:
+                self.end_tick = record_tick
+            else:
+                commands.append((number, command))
+            self.next_record = self.read_record()
+        return commands
+
+    def is_finished(self, tick):
+        return self.end_tick is not None and tick >= self.end_tick
+
+    def close(self):
+        self.file.close()
+
+
+def fast_forward(path):
+    """Plays a recording headless as fast as possible. Returns the finished simulation."""
+    reader = ReplayReader(path)
+    simulation = reader.create_simulation()
+    try:
+        while not simulation.is_game_over() and not reader.is_finished(simulation.ticks):
+            simulation.step(reader.commands_for(simulation.ticks + 1))
+    finally:
+        reader.close()
+    return simulation
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+
+import random
+import time
+from collections import deque
+from arena import Arena, ChunkedArena, Trail, unpack_cell
+from spawn import SpawnPlanner
+from profiler import NULL_PROFILER
+
+# Huge is a 10,000 x 10,000 cell arena seen through a scrolling camera
+GRID_SIZES = {'small': (640, 480), 'medium': (800, 600), 'large': (1024, 768),
+              'huge': (10100, 10100)}
+# Arenas with more cells than this get a chunked occupancy map instead of a flat one
+DENSE_CELLS = 1 << 22
+
+# Trail colour of each player, P1 first. Shared by the turtle front end and raster.
+PLAYER_COLORS = ['#40BBE3', '#E3E329', '#ff0000', '#33cc33']
+
+# Unit step for each of the four headings, in degrees like turtle uses
+DIRECTIONS = {0: (1, 0), 90: (0, 1), 180: (-1, 0), 270: (0, -1)}
+
+# Input commands. Kept as small ints so they can be queued and recorded compactly.
+# The GO_* commands are absolute controls: the direction the player wants to go.
+TURN_LEFT, TURN_RIGHT, ACCELERATE, DECELERATE, GO_EAST, GO_NORTH, GO_WEST, GO_SOUTH = range(8)
+STEER_HEADINGS = {GO_EAST: 0, GO_NORTH: 90, GO_WEST: 180, GO_SOUTH: 270}
+
+
+class Cycle(object):
+    """Pure Python light cycle. Holds everything the game logic needs: position,
+    heading, speed, lives and trail. Coordinates are whole cells with the origin
+    in the centre of the screen, same as turtle."""
+
+    CRASHED = 'crashed'
+    READY = 'ready'
+
+    MIN_SPEED = 1
+    MAX_SPEED = 3
+
+    __slots__ = ('name', 'max_speed', 'number', 'x', 'y', 'heading', 'fd_speed', 'positions',
+                 'coord', 'lives', 'status', 'crash_cause')
+
+    def __init__(self, name, number, start_x, start_y, heading=0, max_speed=MAX_SPEED,
+                 trail_length=None):
+        self.name = name
+        self.max_speed = max_speed
+        self.number = number # Tag used in the arena occupancy grid
+        self.x = start_x
+        self.y = start_y
+        self.heading = heading
+        self.fd_speed = self.MIN_SPEED
+        # Only the newest trail_length cells are kept if it's set, like snake
+        self.positions = Trail(trail_length)
+        self.coord = (start_x, start_y)
+        self.lives = 5
+        self.status = self.READY
+        self.crash_cause = None # Set by the simulation when the light cycle crashes
+
+    def turn_left(self):
+        """90 Degree left turn."""
+        self.heading = (self.heading + 90) % 360
+
+    def turn_right(self):
+        """90 Degree right turn."""
+        self.heading = (self.heading - 90) % 360
+
+    def accelerate(self):
+        """Min. speed = 1, Max. speed = 3 unless the simulation sets another cap."""
+        if self.fd_speed < self.max_speed:
+            self.fd_speed += 1
+
+    def decelerate(self):
+        """Min. speed = 1, therefore player can never stop"""
+        if self.fd_speed > self.MIN_SPEED:
+            self.fd_speed -= 1
+
+    def steer(self, direction):
+        """Absolute controls. Going the way the light cycle already faces speeds it
+        up, the opposite way slows it down, and either side is a turn."""
+        turn = (direction - self.heading) % 360
+        if turn == 0:
+            self.accelerate()
+        elif turn == 90:
+            self.turn_left()
+        elif turn == 180:
+            self.decelerate()
+        else:
+            self.turn_right()
+
+    def apply(self, command):
+        """Carries out one input command."""
+        if command in STEER_HEADINGS:
+            self.steer(STEER_HEADINGS[command])
+        elif command == TURN_LEFT:
+            self.turn_left()
+        elif command == TURN_RIGHT:
+            self.turn_right()
+        elif command == ACCELERATE:
+            self.accelerate()
+        elif command == DECELERATE:
+            self.decelerate()
+
+    def forward(self):
+        """Moves fd_speed cells along the current heading."""
+        dx, dy = DIRECTIONS[self.heading]
+        self.x += dx * self.fd_speed
+        self.y += dy * self.fd_speed
+        self.coord = (self.x, self.y)
+
+    def lose_life(self):
+        """Takes away one life from player"""
+        self.lives -= 1
+        self.status = self.CRASHED
+
+    def respawn(self, x, y, heading):
+        """Respawns light cycle at the coord and heading passed as args, resets speed
+        to 1, and empties the trail for reuse."""
+        self.status = self.READY
+        self.x = x
+        self.y = y
+        self.coord = (x, y)
+        self.heading = heading
+        self.fd_speed = self.MIN_SPEED
+        self.positions.clear()
+
+
+class Move(object):
+    """One light cycle's straight move during a tick, from start (exclusive) to end
+    (inclusive)."""
+
+    __slots__ = ('cycle', 'start', 'end', 'length', 'direction', 'low', 'high')
+
+    def __init__(self, cycle, start, end):
+        self.cycle = cycle
+        self.start = start
+        self.end = end
+        dx, dy = end[0] - start[0], end[1] - start[1]
+        self.length = abs(dx) + abs(dy)
+        self.direction = ((dx > 0) - (dx < 0), (dy > 0) - (dy < 0))
+        first = (start[0] + self.direction[0], start[1] + self.direction[1])
+        # Bounding box of the cells entered, to rule out most pairs of moves cheaply
+        self.low = (min(first[0], end[0]), min(first[1], end[1]))
+        self.high = (max(first[0], end[0]), max(first[1], end[1]))
+
+    def time(self, steps):
+        """Fraction of the tick at which the cycle enters the cell steps along."""
+        return steps / self.length
+
+    def cell(self, steps):
+        return (self.start[0] + self.direction[0] * steps,
+                self.start[1] + self.direction[1] * steps)
+
+    def steps_to(self, cell):
+        return abs(cell[0] - self.start[0]) + abs(cell[1] - self.start[1])
+
+    def contains(self, cell):
+        """Whether the move enters cell."""
+        if self.length == 0:
+            return False
+        steps = self.steps_to(cell)
+        return 1 <= steps <= self.length and self.cell(steps) == cell
+
+    def shared_cells(self, other):
+        """(steps for self, steps for other, cell) for every cell both moves enter."""
+        if self.length == 0 or other.length == 0:
+            return []
+        if self.low[0] > other.high[0] or other.low[0] > self.high[0] or \
+        self.low[1] > other.high[1] or other.low[1] > self.high[1]:
+            return []
+        if self.direction[0] and other.direction[0] or self.direction[1] and other.direction[1]:
+            # Parallel: only moves along the same row or column overlap
+            axis = 0 if self.direction[0] else 1
+            if self.start[1 - axis] != other.start[1 - axis]:
+                return []
+            low, high = self.span(axis)
+            other_low, other_high = other.span(axis)
+            cells = []
+            for position in range(max(low, other_low), min(high, other_high) + 1):
+                cell = [0, 0]
+                cell[axis], cell[1 - axis] = position, self.start[1 - axis]
+                cells.append(tuple(cell))
+        else:
+            # Perpendicular: at most the one crossing cell
+            vertical = self if self.direction[1] else other
+            horizontal = other if vertical is self else self
+            cells = [(vertical.start[0], horizontal.start[1])]
+        return [(self.steps_to(cell), other.steps_to(cell), cell)
+                for cell in cells if self.contains(cell) and other.contains(cell)]
+
+    def span(self, axis):
+        """Lowest and highest position along axis of the cells the move enters."""
+        first = self.start[axis] + self.direction[axis]
+        return min(first, self.end[axis]), max(first, self.end[axis])
+
+    def cells_before(self, crash_time):
+        """Cells entered before crash_time, or every cell if crash_time is None."""
+        cells = []
+        for steps in range(1, self.length + 1):
+            if crash_time is not None and self.time(steps) >= crash_time:
+                break
+            cells.append(self.cell(steps))
+        return cells
+
+
+class InputQueue(object):
+    """Timestamped input commands waiting for the next tick. Each player gets at
+    most per_tick commands applied per tick; the rest wait for the following
+    ticks, so two quick presses can't combine into a reversal within one tick.
+    Button mashing past limit pending commands is dropped."""
+
+    def __init__(self, per_tick=1, limit=8, timer=time.perf_counter):
+        self.per_tick = per_tick
+        self.limit = limit
+        self.timer = timer
+        self.pending = {}
+
+    def push(self, number, command, timestamp=None):
+        """Queues a command for player number."""
+        if timestamp is None:
+            timestamp = self.timer()
+        queue = self.pending.setdefault(number, deque(maxlen=self.limit))
+        queue.append((timestamp, command))
+
+    def pop_tick(self):
+        """Removes and returns this tick's commands as (number, command) tuples,
+        in the order they were pressed."""
+        events = []
+        for number, queue in self.pending.items():
+            for i in range(min(self.per_tick, len(queue))):
+                timestamp, command = queue.popleft()
+                events.append((timestamp, number, command))
+        events.sort()
+        return [(number, command) for timestamp, number, command in events]
+
+    def clear(self):
+        self.pending = {}
+
+
+class Simulation(object):
+    """Headless game core. Owns the light cycles and the arena and advances them one
+    tick at a time. Nothing in here touches turtle or Tk, so matches can be run
+    without a display."""
+
+    # Crash causes
+    WALL = 'wall'
+    SELF = 'self'
+    ENEMY = 'enemy'
+    HEAD_ON = 'head-on' # Two or more light cycles entered the same cell at once
+
+    def __init__(self, width, height, seed=None, inputs_per_tick=1, max_speed=Cycle.MAX_SPEED,
+                 trail_length=None):
+        self.width = width
+        self.height = height
+        # Everything random in a match comes from the seed, so it can be replayed
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        # Each side of the border is 50 pixels from the edge of the screen
+        self.x_boundary = (width / 2) - 50
+        self.y_boundary = (height / 2) - 50
+        # Furthest cell from the centre a light cycle can be in without crashing.
+        # Deviation of 3 on edge to cosmetically match impact.
+        self.x_limit = int(abs(self.x_boundary) - 3)
+        self.y_limit = int(abs(self.y_boundary) - 3)
+        self.max_speed = max_speed
+        # Longest a trail gets before its oldest cells disappear, or None for no limit
+        self.trail_length = trail_length or None
+        self.random = random.Random(seed)
+        if (2 * int(self.x_boundary) + 1) * (2 * int(self.y_boundary) + 1) > DENSE_CELLS:
+            self.arena = ChunkedArena(self.x_boundary, self.y_boundary)
+        else:
+            self.arena = Arena(self.x_boundary, self.y_boundary)
+        self.spawns = SpawnPlanner(self.x_limit, self.y_limit, DIRECTIONS)
+        self.cycles = []
+        self.inputs = InputQueue(inputs_per_tick)
+        self.applied = [] # Commands applied on the last tick
+        self.recorder = None # Optional ReplayWriter
+        self.profiler = NULL_PROFILER
+        self.ticks = 0
+
+    def create_cycles(self, number=2):
+        """Creates light cycles named P1, P2, ... at planned spawn points. The arena
+        stores player numbers in bytes, which caps a match at 255 light cycles."""
+        if number > 255:
+            raise ValueError("No more than 255 players allowed.")
+        self.cycles = []
+        for i, (x, y, heading) in enumerate(self.spawns.place(number, self.random)):
+            self.cycles.append(Cycle('P' + str(i + 1), i + 1, x, y, heading,
+                                     max_speed=self.max_speed,
+                                     trail_length=self.trail_length))
+        return self.cycles
+
+    def is_outside_boundary(self, cycle, coord=None):
+        """Checks if light cycle (or coord) is out of bounds using border coord."""
+        if coord is None:
+            coord = cycle.coord
+        return abs(coord[0]) > self.x_limit or abs(coord[1]) > self.y_limit
+
+    def crash_cause(self, cycle, coord):
+        """Why coord is a crash for cycle, or None if it's free."""
+        if self.is_outside_boundary(cycle, coord):
+            return self.WALL
+        if self.is_collision_with_enemy(cycle, coord):
+            return self.ENEMY
+        if self.is_collision_with_self(cycle, coord):
+            return self.SELF
+        return None
+
+    def is_collision_with_enemy(self, cycle, coord=None):
+        """Collision check with other player. Looks up the owner of the cell the
+        light cycle is moving into (its current coord by default)."""
+        if coord is None:
+            coord = cycle.coord
+        owner = self.arena.owner(*coord)
+        return owner != Arena.EMPTY and owner != cycle.number
+
+    def is_collision_with_self(self, cycle, coord=None):
+        """Collision check with own trail. The cell the light cycle is already
+        sitting on doesn't count."""
+        if coord is None:
+            coord = cycle.coord
+        if coord == cycle.positions.head:
+            return False
+        return self.arena.owner(*coord) == cycle.number
+
+    def claim(self, cycle, cells):
+        """Adds a straight run of cells to the cycle's trail and the arena. A trail
+        with a length limit loses as many of its oldest cells, which are cleared from
+        the arena, so the cost stays the same however long the round goes on."""
+        if not cells:
+            return
+        trail = cycle.positions
+        if trail.capacity:
+            skipped = len(cells) - trail.capacity
+            if skipped > 0:
+                # A move longer than the whole trail keeps only its newest cells
+                trail.skip(skipped)
+                cells = cells[skipped:]
+            mark = self.arena.mark
+            for key in trail.drop(len(trail) + len(cells) - trail.capacity):
+                x, y = unpack_cell(key)
+                mark(x, y, Arena.EMPTY)
+        trail.extend(cells)
+        self.arena.mark_line(cells[0], cells[-1], cycle.number)
+
+    def push_input(self, number, command, timestamp=None):
+        """Queues an input command for player number, applied on the next tick."""
+        self.inputs.push(number, command, timestamp)
+
+    def apply_inputs(self, commands=None):
+        """Applies this tick's commands in order, taken from the input queue unless
+        given as (number, command) tuples. Heading and speed only ever change here,
+        so every movement goes through step's collision checks."""
+        if commands is None:
+            commands = self.inputs.pop_tick()
+        self.applied = commands
+        for number, command in commands:
+            self.cycles[number - 1].apply(command)
+        if self.recorder:
+            self.recorder.record(self.ticks, commands)
+
+    def step(self, commands=None):
+        """Advances every light cycle by one tick. Returns a list of (cycle, coord)
+        for each crash, where coord is the cell it crashed into. If anyone crashed
+        the grid is reset before returning."""
+        self.ticks += 1
+        self.profiler.start()
+        self.apply_inputs(commands)
+        self.profiler.lap('input')
+        crashes = self.move_cycles()
+        if crashes:
+            self.reset_grid()
+            self.profiler.lap('reset')
+        return crashes
+
+    def move_cycles(self):
+        """Moves every light cycle at once, so the order of self.cycles doesn't decide
+        who wins a tie. Each cycle enters the cells of its move at evenly spaced
+        moments through the tick (a speed 3 cycle enters cells at 1/3, 2/3, and 1).
+
+        Every move is swept as one segment against the walls and the trails laid
+        before this tick, and against the other cycles' moves this tick, so the cost
+        doesn't grow with speed. The resulting crash events are handled in time
+        order: a cycle entering a cell another cycle entered earlier this tick hits
+        its trail, and cycles entering the same free cell at the same moment all
+        crash head-on."""
+        moves = []
+        for cycle in self.cycles:
+            # A fresh spawn has no trail yet; its first move is swept from the spawn
+            start = cycle.positions.head or cycle.coord
+            cycle.forward()
+            moves.append(Move(cycle, start, cycle.coord))
+        self.profiler.lap('move')
+
+        # (time, cycle index, cause, cell, index of the cycle that got there first)
+        events = []
+        for i, move in enumerate(moves):
+            hit = self.first_obstacle(move)
+            if hit:
+                events.append((move.time(hit[0]), i, hit[1], hit[2], None))
+        for i in range(len(moves)):
+            for j in range(i + 1, len(moves)):
+                for k_i, k_j, cell in moves[i].shared_cells(moves[j]):
+                    t_i, t_j = moves[i].time(k_i), moves[j].time(k_j)
+                    if t_i == t_j:
+                        events.append((t_i, i, self.HEAD_ON, cell, j))
+                        events.append((t_j, j, self.HEAD_ON, cell, i))
+                    elif t_j < t_i:
+                        events.append((t_i, i, self.ENEMY, cell, j))
+                    else:
+                        events.append((t_j, j, self.ENEMY, cell, i))
+        if not events:
+            for move in moves:
+                self.claim(move.cycle, move.cells_before(None))
+            self.profiler.lap('collide')
+            return []
+        events.sort(key=lambda event: event[0])
+
+        stopped = {} # Cycle index -> time it crashed
+        crashes = []
+        k = 0
+        while k < len(events):
+            # Every event happening at the same moment is judged on what happened before it
+            moment = events[k][0]
+            group = []
+            while k < len(events) and events[k][0] == moment:
+                group.append(events[k])
+                k += 1
+            for moment, i, cause, cell, other in group:
+                if i in stopped and stopped[i] < moment:
+                    continue
+                if other is not None:
+                    got_there = moves[other].time(moves[other].steps_to(cell))
+                    if other in stopped and stopped[other] < got_there:
+                        continue # The other cycle crashed before reaching the cell
+                    if cause == self.HEAD_ON and other in stopped and stopped[other] < moment:
+                        continue
+                if i not in stopped:
+                    stopped[i] = moment
+                    cycle = moves[i].cycle
+                    cycle.crash_cause = cause
+                    cycle.lose_life()
+                    crashes.append((cycle, cell))
+
+        for i, move in enumerate(moves):
+            if i in stopped:
+                self.claim(move.cycle, move.cells_before(stopped[i]))
+            else:
+                self.claim(move.cycle, move.cells_before(None))
+        self.profiler.lap('collide')
+        return crashes
+
+    def first_obstacle(self, move):
+        """First wall or trail cell on a move, as (steps, cause, cell), or None."""
+        wall = self.wall_steps(move)
+        hit = self.arena.first_occupied(move.start, move.end)
+        if hit and (wall is None or hit[0] < wall):
+            steps, cell, owner = hit
+            if owner == move.cycle.number:
+                return (steps, self.SELF, cell)
+            return (steps, self.ENEMY, cell)
+        if wall is not None:
+            return (wall, self.WALL, move.cell(wall))
+        return None
+
+    def wall_steps(self, move):
+        """Steps along the move to the first cell past the border, or None."""
+        x, y = move.start
+        dx, dy = move.direction
+        if dx:
+            position, step, limit = x, dx, self.x_limit
+        else:
+            position, step, limit = y, dy, self.y_limit
+        # First k >= 1 with abs(position + step * k) > limit
+        steps = limit + 1 - position * step
+        if steps <= move.length:
+            return max(steps, 1)
+        return None
+
+    def reset_grid(self):
+        """Clears the arena and respawns every light cycle. Inputs pressed before
+        the crash are dropped."""
+        self.arena.clear()
+        self.inputs.clear()
+        spawns = self.spawns.place(len(self.cycles), self.random)
+        for cycle, (x, y, heading) in zip(self.cycles, spawns):
+            cycle.respawn(x, y, heading)
+
+    def is_game_over(self):
+        """Checks to see if any player has run out of lives."""
+        for cycle in self.cycles:
+            if cycle.lives <= 0:
+                return True
+        return False
+
+    def winner(self):
+        """Once the game is over, returns the light cycle with the most lives left.
+        Returns None while the game is on, or if the lead is tied."""
+        if not self.is_game_over():
+            return None
+        most = max(cycle.lives for cycle in self.cycles)
+        leaders = [cycle for cycle in self.cycles if cycle.lives == most]
+        if most > 0 and len(leaders) == 1:
+            return leaders[0]
+        return None
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# Candidate tables, built once per play area and shared by every simulation on it
+_tables = {}
+
+
+class SpawnPlanner(object):
+    """Picks spawn points and headings that can't end a round at once. Candidates are
+    (x, y, heading) on a lattice across the play area whose runway (cells straight
+    ahead before the wall) is at least runway long, and that are at least margin
+    cells from every wall so a turn isn't fatal either; they're worked out once per
+    play area, so a respawn is a few random picks. Picks are at least separation
+    cells apart on one axis or the other, and no pick's runway crosses another's."""
+
+    SPACING = 10 # Cells between lattice points, widened on big areas
+    POINTS = 100 # Most lattice points along either axis
+
+    def __init__(self, x_limit, y_limit, directions, runway=100, separation=100, margin=50):
+        self.directions = directions
+        self.runway = runway
+        self.separation = separation
+        self.margin = margin
+        key = (x_limit, y_limit, runway, margin)
+        if key not in _tables:
+            _tables[key] = self.candidates(x_limit, y_limit)
+        self.table = _tables[key]
+
+    def candidates(self, x_limit, y_limit):
+        """Every lattice cell and heading with a clear runway to the wall."""
+        table = []
+        step = max(self.SPACING, (2 * max(x_limit, y_limit)) // self.POINTS)
+        for x in range(-x_limit + self.margin, x_limit - self.margin + 1, step):
+            for y in range(-y_limit + self.margin, y_limit - self.margin + 1, step):
+                for heading, (dx, dy) in sorted(self.directions.items()):
+                    # Cells ahead before leaving the play area
+                    if dx:
+                        clear = x_limit - x * dx
+                    else:
+                        clear = y_limit - y * dy
+                    if clear >= self.runway:
+                        table.append((x, y, heading))
+        return table
+
+    def lane(self, spawn):
+        """The spawn's runway as a box (x low, y low, x high, y high)."""
+        x, y, heading = spawn
+        dx, dy = self.directions[heading]
+        end_x, end_y = x + dx * self.runway, y + dy * self.runway
+        return (min(x, end_x), min(y, end_y), max(x, end_x), max(y, end_y))
+
+    def conflicts(self, spawn, other):
+        if abs(spawn[0] - other[0]) >= self.separation or \
+        abs(spawn[1] - other[1]) >= self.separation:
+            # Far enough apart, unless one runway runs into the other
+            a, b = self.lane(spawn), self.lane(other)
+            return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+        return True
+
+    def place(self, count, rng, tries=50):
+        """count spawns as (x, y, heading). If the area is too crowded to keep a pick
+        apart from the others in a few tries, the last try is taken rather than
+        stalling."""
+        spawns = []
+        for i in range(count):
+            for attempt in range(tries):
+                spawn = self.table[rng.randrange(len(self.table))]
+                if not any(self.conflicts(spawn, other) for other in spawns):
+                    break
+            spawns.append(spawn)
+        return spawns